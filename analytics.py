@@ -0,0 +1,235 @@
+"""Sales analytics served from incrementally maintained rollup tables.
+
+Every flush that adds, changes or deletes orders or order lines applies the
+matching deltas to the rollups in the same transaction, through a
+`before_flush` listener on all ORM sessions (sync and async). Writes that
+bypass the ORM, such as the bulk order endpoint, call `apply_order_deltas`
+themselves. Revenue uses the unit price stored on each order line when it was
+sold, so later menu price changes and deleted items leave it untouched, and
+`python analytics.py rebuild` recomputes the same totals from the full order
+history.
+"""
+
+import sys
+from typing import List
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import metrics
+from database import SessionLocal, get_db
+from models import CustomerSpendRollup, HourlySalesRollup, ItemSalesRollup, Order, OrderItem
+from schemas import CustomerSpend, HourlySales, ItemSales
+
+HOUR = 3600
+
+router = APIRouter(prefix="/analytics", route_class=metrics.route_class)
+
+
+def hour_of(timestamp: int) -> int:
+    """Start of the hour containing `timestamp`."""
+    return timestamp - timestamp % HOUR
+
+
+def apply_order_deltas(db: Session, orders=(), lines=()) -> None:
+    """Add signed changes to the rollups within the session's transaction.
+
+    `orders` holds `(sign, customer_id, timestamp)` for each order added (+1) or
+    removed (-1); `lines` holds `(sign, customer_id, timestamp, item_id, quantity, price)`
+    for each order line, with the unit price stored on the line.
+    """
+    items, hours, customers = {}, {}, {}
+    for sign, customer_id, timestamp in orders:
+        hours.setdefault(hour_of(timestamp), [0, 0, 0.0])[0] += sign
+        customers.setdefault(customer_id, [0, 0, 0.0])[0] += sign
+    for sign, customer_id, timestamp, item_id, quantity, price in lines:
+        quantity *= sign
+        revenue = quantity * _price(price)
+        item_totals = items.setdefault(item_id, [0, 0.0])
+        item_totals[0] += quantity
+        item_totals[1] += revenue
+        hour_totals = hours.setdefault(hour_of(timestamp), [0, 0, 0.0])
+        for totals in (hour_totals, customers.setdefault(customer_id, [0, 0, 0.0])):
+            totals[1] += quantity
+            totals[2] += revenue
+
+    _upsert(db, ItemSalesRollup, "item_id", ("quantity", "revenue"), items)
+    _upsert(db, HourlySalesRollup, "hour", ("orders", "quantity", "revenue"), hours)
+    _upsert(db, CustomerSpendRollup, "customer_id", ("orders", "quantity", "revenue"), customers)
+
+
+def _upsert(db: Session, model, key: str, columns, deltas: dict) -> None:
+    rows = [dict(zip((key, *columns), (k, *values))) for k, values in deltas.items() if any(values)]
+    if not rows:
+        return
+    table = model.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[key],
+        set_={column: table.c[column] + statement.excluded[column] for column in columns},
+    )
+    db.execute(statement, rows)
+
+
+def _committed(obj, key: str):
+    """Value of `key` as of the last flush, before any pending change."""
+    history = inspect(obj).attrs[key].history
+    return history.deleted[0] if history.deleted else getattr(obj, key)
+
+
+def _quantity(value) -> int:
+    # Mirrors the column default, which is only applied at INSERT time.
+    return 1 if value is None else value
+
+
+def _price(value) -> float:
+    # Lines written before unit prices were recorded and never backfilled count as free, as in the scans.
+    return 0.0 if value is None else value
+
+
+@event.listens_for(Session, "before_flush")
+def _track_order_changes(session, flush_context, instances):
+    """Translate pending Order and OrderItem changes into rollup deltas."""
+    orders, lines = [], []
+    for obj in session.new:
+        if isinstance(obj, Order):
+            orders.append((1, obj.customer_id, obj.timestamp))
+        elif isinstance(obj, OrderItem):
+            order = obj.order or session.get(Order, obj.order_id)
+            lines.append((1, order.customer_id, order.timestamp, obj.item_id, _quantity(obj.quantity), obj.price))
+
+    for obj in session.deleted:
+        if isinstance(obj, Order):
+            orders.append((-1, _committed(obj, "customer_id"), _committed(obj, "timestamp")))
+        elif isinstance(obj, OrderItem):
+            order = session.get(Order, _committed(obj, "order_id"))
+            lines.append((
+                -1, _committed(order, "customer_id"), _committed(order, "timestamp"),
+                _committed(obj, "item_id"), _quantity(_committed(obj, "quantity")), _committed(obj, "price"),
+            ))
+
+    for obj in session.dirty:
+        if isinstance(obj, Order) and obj not in session.deleted:
+            old = (_committed(obj, "customer_id"), _committed(obj, "timestamp"))
+            new = (obj.customer_id, obj.timestamp)
+            if old == new:
+                continue
+            orders.extend([(-1, *old), (1, *new)])
+            for line in obj.items:
+                if line in session.new or line in session.deleted:
+                    continue
+                sold = (line.item_id, _quantity(_committed(line, "quantity")), _committed(line, "price"))
+                lines.extend([(-1, *old, *sold), (1, *new, *sold)])
+        elif isinstance(obj, OrderItem) and obj not in session.deleted:
+            delta = _quantity(obj.quantity) - _quantity(_committed(obj, "quantity"))
+            if delta:
+                lines.append((1, obj.order.customer_id, obj.order.timestamp, obj.item_id, delta, obj.price))
+
+    if orders or lines:
+        apply_order_deltas(session, orders, lines)
+
+
+def item_sales_scan():
+    """Per-item totals computed from the full order history."""
+    price = func.coalesce(OrderItem.price, 0.0)
+    return (
+        select(
+            OrderItem.item_id,
+            func.sum(OrderItem.quantity).label("quantity"),
+            func.sum(OrderItem.quantity * price).label("revenue"),
+        )
+        .group_by(OrderItem.item_id)
+    )
+
+
+def _group_scan(key):
+    """Orders, quantity and revenue grouped by `key`, computed from the full order history."""
+    price = func.coalesce(OrderItem.price, 0.0)
+    order_counts = select(key.label("key"), func.count().label("orders")).group_by(key).subquery()
+    line_totals = (
+        select(
+            key.label("key"),
+            func.sum(OrderItem.quantity).label("quantity"),
+            func.sum(OrderItem.quantity * price).label("revenue"),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .group_by(key)
+        .subquery()
+    )
+    return select(
+        order_counts.c.key,
+        order_counts.c.orders,
+        func.coalesce(line_totals.c.quantity, 0).label("quantity"),
+        func.coalesce(line_totals.c.revenue, 0.0).label("revenue"),
+    ).outerjoin(line_totals, line_totals.c.key == order_counts.c.key)
+
+
+def hourly_sales_scan():
+    """Per-hour totals computed from the full order history."""
+    return _group_scan(Order.timestamp - Order.timestamp % HOUR)
+
+
+def customer_spend_scan():
+    """Per-customer totals computed from the full order history."""
+    return _group_scan(Order.customer_id)
+
+
+def rebuild_rollups(db: Session) -> None:
+    """Recompute every rollup from the order history, e.g. to backfill an existing database."""
+    for model in (ItemSalesRollup, HourlySalesRollup, CustomerSpendRollup):
+        db.execute(delete(model))
+    db.execute(insert(ItemSalesRollup).from_select(["item_id", "quantity", "revenue"], item_sales_scan()))
+    db.execute(insert(HourlySalesRollup).from_select(["hour", "orders", "quantity", "revenue"], hourly_sales_scan()))
+    db.execute(insert(CustomerSpendRollup).from_select(
+        ["customer_id", "orders", "quantity", "revenue"], customer_spend_scan(),
+    ))
+    db.commit()
+
+
+@router.get("/best-sellers", response_model=List[ItemSales])
+def best_sellers(limit: int = Query(10, ge=1, le=100), by: str = Query("quantity", regex="^(quantity|revenue)$"),
+                 db: Session = Depends(get_db)):
+    """Top-selling items by quantity or revenue."""
+    column = getattr(ItemSalesRollup, by)
+    return db.query(ItemSalesRollup).order_by(column.desc(), ItemSalesRollup.item_id).limit(limit).all()
+
+@router.get("/revenue-by-hour", response_model=List[HourlySales])
+def revenue_by_hour(from_ts: int = Query(..., alias="from"), to_ts: int = Query(..., alias="to"),
+                    db: Session = Depends(get_db)):
+    """Orders, quantity and revenue for each hour starting in `[from, to)`."""
+    return (
+        db.query(HourlySalesRollup)
+        .filter(HourlySalesRollup.hour >= from_ts, HourlySalesRollup.hour < to_ts)
+        .order_by(HourlySalesRollup.hour)
+        .all()
+    )
+
+@router.get("/customers/top", response_model=List[CustomerSpend])
+def top_customers(limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+    """Customers with the highest total spend."""
+    return (
+        db.query(CustomerSpendRollup)
+        .order_by(CustomerSpendRollup.revenue.desc(), CustomerSpendRollup.customer_id)
+        .limit(limit)
+        .all()
+    )
+
+@router.get("/customers/{customer_id}", response_model=CustomerSpend)
+def customer_spend(customer_id: int, db: Session = Depends(get_db)):
+    """Total orders, quantity and spend for one customer; zeros if they have not ordered."""
+    rollup = db.query(CustomerSpendRollup).filter(CustomerSpendRollup.customer_id == customer_id).first()
+    if rollup is None:
+        return {"customer_id": customer_id, "orders": 0, "quantity": 0, "revenue": 0.0}
+    return rollup
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python analytics.py rebuild")
+    session = SessionLocal()
+    try:
+        rebuild_rollups(session)
+    finally:
+        session.close()
@@ -0,0 +1,260 @@
+"""Async versions of the customer, item and order endpoints.
+
+Used instead of the sync routes in `main` when `DB_MODE` is "async". Every
+object returned is fully loaded before the handler returns, since lazy loads
+cannot run while FastAPI serializes the response.
+"""
+
+from typing import List, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+import customer_search
+import idempotency
+import metrics
+import order_events
+import order_validation
+import serializers
+from database import get_async_db
+from menu_cache import etag_matches, menu_cache
+from models import Customer, Item, Order, OrderItem
+from schemas import (
+    CustomerCreate, CustomerResponse, ItemCreate, ItemResponse, OrderCreate, OrderPage, OrderResponse,
+)
+from serializers import ORJSONResponse
+
+router = APIRouter(route_class=metrics.route_class)
+
+
+def _orders_with_items():
+    """Order select that loads line items and their menu items in two extra SELECTs, not one per row."""
+    return select(Order).options(selectinload(Order.items).selectinload(OrderItem.item))
+
+
+async def _get_order(db: AsyncSession, order_id: int) -> Optional[Order]:
+    return (await db.execute(_orders_with_items().where(Order.id == order_id))).scalars().first()
+
+
+async def _order_dicts(db: AsyncSession, query) -> List[dict]:
+    """Run an `orders_query` and load its line items in one extra SELECT, as plain dicts."""
+    order_rows = (await db.execute(query)).all()
+    if not order_rows:
+        return []
+    line_rows = (await db.execute(serializers.lines_query(row.id for row in order_rows))).all()
+    return serializers.order_dicts(order_rows, line_rows)
+
+
+async def _existing_ids(db: AsyncSession, column, ids):
+    """Return the subset of `ids` present in `column`, using chunked set-based lookups."""
+    found = set()
+    for chunk in order_validation.id_chunks(ids):
+        found.update((await db.execute(select(column).where(column.in_(chunk)))).scalars())
+    return found
+
+
+async def _item_prices(db: AsyncSession, ids) -> dict:
+    """Return the current price of each of `ids` that exists, using chunked set-based lookups."""
+    prices = {}
+    for chunk in order_validation.id_chunks(ids):
+        prices.update((await db.execute(select(Item.id, Item.price).where(Item.id.in_(chunk)))).all())
+    return prices
+
+
+async def _get_or_404(db: AsyncSession, model, object_id: int, detail: str):
+    obj = await db.get(model, object_id)
+    if obj is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return obj
+
+
+# Customer endpoints
+@router.post("/customers/", response_model=CustomerResponse)
+async def create_customer(customer: CustomerCreate, db: AsyncSession = Depends(get_async_db)):
+    """Create a new customer entry in the database."""
+    db_customer = Customer(name=customer.name, phone=customer.phone)
+    db.add(db_customer)
+    await db.commit()
+    return db_customer
+
+@router.get("/customers/by-phone/{phone}", response_model=CustomerResponse)
+async def read_customer_by_phone(phone: str, db: AsyncSession = Depends(get_async_db)):
+    """Retrieve a customer by exact phone number."""
+    row = (await db.execute(customer_search.by_phone_query(phone))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return ORJSONResponse(serializers.customer_dict(row))
+
+@router.get("/customers/search", response_model=List[CustomerResponse])
+async def search_customers(
+    q: str,
+    limit: int = Query(customer_search.CUSTOMER_SEARCH_LIMIT, ge=1, le=customer_search.CUSTOMER_SEARCH_MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Typeahead search on phone prefix, or on prefixes of the words in a customer's name."""
+    query = customer_search.search_query(q, limit)
+    rows = (await db.execute(query)).all() if query is not None else []
+    return ORJSONResponse([serializers.customer_dict(row) for row in rows])
+
+@router.get("/customers/{customer_id}", response_model=CustomerResponse)
+async def read_customer(customer_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Retrieve a customer by ID."""
+    row = (await db.execute(serializers.customer_query(customer_id))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return ORJSONResponse(serializers.customer_dict(row))
+
+@router.delete("/customers/{customer_id}", status_code=204, response_class=Response)
+async def delete_customer(customer_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Delete a customer by ID."""
+    db_customer = await _get_or_404(db, Customer, customer_id, "Customer not found")
+    await db.delete(db_customer)
+    await db.commit()
+
+@router.put("/customers/{customer_id}", response_model=CustomerResponse)
+async def update_customer(customer_id: int, customer: CustomerCreate, db: AsyncSession = Depends(get_async_db)):
+    """Update a customer's information."""
+    db_customer = await _get_or_404(db, Customer, customer_id, "Customer not found")
+    db_customer.name = customer.name
+    db_customer.phone = customer.phone
+    await db.commit()
+    return db_customer
+
+# Item endpoints
+@router.post("/items/", response_model=ItemResponse)
+async def create_item(item: ItemCreate, db: AsyncSession = Depends(get_async_db)):
+    """Create a new item entry in the database."""
+    db_item = Item(name=item.name, price=item.price)
+    db.add(db_item)
+    await db.commit()
+    menu_cache.write(ItemResponse.from_orm(db_item))
+    return db_item
+
+@router.get("/items/", response_model=List[ItemResponse])
+async def read_items(if_none_match: str = Header(None), db: AsyncSession = Depends(get_async_db)):
+    """Retrieve the full menu from the cached JSON snapshot, honouring If-None-Match."""
+    cached = menu_cache.cached_snapshot()
+    if cached is None:
+        generation = menu_cache.generation
+        items = (await db.execute(select(Item).order_by(Item.id))).scalars()
+        cached = menu_cache.store_snapshot([ItemResponse.from_orm(item) for item in items], generation)
+    body, etag = cached
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+@router.get("/items/{item_id}", response_model=ItemResponse)
+async def read_item(item_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Retrieve an item by ID, served from the menu cache when possible."""
+    cached = menu_cache.get(item_id)
+    if cached is not None:
+        return ORJSONResponse(serializers.item_dict(cached))
+    generation = menu_cache.generation
+    item = ItemResponse.from_orm(await _get_or_404(db, Item, item_id, "Item not found"))
+    menu_cache.put(item, generation)
+    return ORJSONResponse(serializers.item_dict(item))
+
+@router.delete("/items/{item_id}", status_code=204, response_class=Response)
+async def delete_item(item_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Delete an item by ID."""
+    db_item = await _get_or_404(db, Item, item_id, "Item not found")
+    await db.delete(db_item)
+    await db.commit()
+    menu_cache.invalidate(item_id)
+
+@router.put("/items/{item_id}", response_model=ItemResponse)
+async def update_item(item_id: int, item: ItemCreate, db: AsyncSession = Depends(get_async_db)):
+    """Update an item's details."""
+    db_item = await _get_or_404(db, Item, item_id, "Item not found")
+    db_item.name = item.name
+    db_item.price = item.price
+    await db.commit()
+    menu_cache.write(ItemResponse.from_orm(db_item))
+    return db_item
+
+# Order endpoints
+async def _add_order(db: AsyncSession, order: OrderCreate) -> ORJSONResponse:
+    """Add and flush a new order, returning its response without committing."""
+    customer_ids = await _existing_ids(db, Customer.id, {order.customer_id})
+    prices = await _item_prices(db, {oi.item_id for oi in order.items})
+    order_validation.check_order(order, customer_ids, prices.keys())
+    db_order = Order(customer_id=order.customer_id, timestamp=order.timestamp, notes=order.notes)
+    for order_item in order.items:
+        db_order.items.append(OrderItem(
+            item_id=order_item.item_id, quantity=order_item.quantity, price=prices[order_item.item_id],
+        ))
+    db.add(db_order)
+    await db.flush()
+    response = ORJSONResponse((await _order_dicts(db, serializers.orders_query().where(Order.id == db_order.id)))[0])
+    order_events.publish_after_commit(db, "created", response.body)
+    return response
+
+@router.post("/orders/", response_model=OrderResponse)
+async def create_order(
+    order: OrderCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=idempotency.MAX_KEY_LENGTH),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Create a new order in the database.
+
+    Retries that send the same `Idempotency-Key` get the first response back without creating another order.
+    """
+    if idempotency_key is not None:
+        fingerprint = idempotency.fingerprint(order)
+        return await idempotency.run_once_async(db, idempotency_key, fingerprint, lambda: _add_order(db, order))
+    response = await _add_order(db, order)
+    await db.commit()
+    return response
+
+@router.get("/orders/", response_model=OrderPage)
+async def list_orders(
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """List orders by ascending ID using keyset pagination.
+
+    Pass the returned `next_after_id` as `after_id` to fetch the following page.
+    """
+    query = serializers.orders_query()
+    if after_id is not None:
+        query = query.where(Order.id > after_id)
+    orders = await _order_dicts(db, query.order_by(Order.id).limit(limit))
+    next_after_id = orders[-1]["id"] if len(orders) == limit else None
+    return ORJSONResponse({"orders": orders, "next_after_id": next_after_id})
+
+@router.get("/orders/{order_id}", response_model=OrderResponse)
+async def read_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Retrieve an order by ID."""
+    orders = await _order_dicts(db, serializers.orders_query().where(Order.id == order_id))
+    if not orders:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return ORJSONResponse(orders[0])
+
+@router.delete("/orders/{order_id}", status_code=204, response_class=Response)
+async def delete_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Delete an order by ID."""
+    db_order = await _get_order(db, order_id)
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    await db.delete(db_order)
+    order_events.publish_after_commit(db, "deleted", orjson.dumps({"id": order_id}))
+    await db.commit()
+
+@router.put("/orders/{order_id}", response_model=OrderResponse)
+async def update_order(order_id: int, order: OrderCreate, db: AsyncSession = Depends(get_async_db)):
+    """Update an order's details."""
+    db_order = await _get_order(db, order_id)
+    if not db_order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    db_order.customer_id = order.customer_id
+    db_order.timestamp = order.timestamp
+    db_order.notes = order.notes
+    await db.flush()
+    response = ORJSONResponse((await _order_dicts(db, serializers.orders_query().where(Order.id == order_id)))[0])
+    order_events.publish_after_commit(db, "updated", response.body)
+    await db.commit()
+    return response
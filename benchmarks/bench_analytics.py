@@ -0,0 +1,151 @@
+"""Compare rollup reads with the equivalent full-scan aggregation SQL.
+
+Seeds a large synthetic order history, backfills the rollups with
+`analytics.rebuild_rollups`, then times each report both ways and checks
+that they agree. It then changes orders through the API, including a menu
+price change and an item deletion between placing and deleting an order, and
+checks that the incrementally maintained rollups still match a full scan. The
+script exits non-zero if any check fails.
+
+Usage: python benchmarks/bench_analytics.py [orders] [repeats]
+"""
+
+import sys
+
+from common import load_app, timed
+
+main = load_app()
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import analytics  # noqa: E402
+import database  # noqa: E402
+from models import (  # noqa: E402
+    Customer, CustomerSpendRollup, HourlySalesRollup, Item, ItemSalesRollup, Order, OrderItem,
+)
+
+SEED_BATCH = 10_000
+
+
+def item_price(index):
+    return 4.0 + index % 9
+
+
+def seed(orders, customers=20_000, items=40):
+    with database.engine.begin() as conn:
+        conn.execute(Customer.__table__.insert(), [
+            {"name": f"Customer {i}", "phone": f"555-{i:06d}"} for i in range(customers)
+        ])
+        conn.execute(Item.__table__.insert(), [{"name": f"Dosa {i}", "price": item_price(i)} for i in range(items)])
+        for start in range(0, orders, SEED_BATCH):
+            ids = range(start + 1, min(orders, start + SEED_BATCH) + 1)
+            conn.execute(Order.__table__.insert(), [
+                {"id": n, "customer_id": n * 7919 % customers + 1, "timestamp": 1_700_000_000 + n * 37}
+                for n in ids
+            ])
+            conn.execute(OrderItem.__table__.insert(), [
+                {"order_id": n, "item_id": i + 1, "quantity": k, "price": item_price(i)}
+                for n in ids for k in (1, 2) for i in [(n + 7 * k) % items]
+            ])
+
+
+def top(query, column, key, limit=10):
+    columns = query.selected_columns
+    return query.order_by(columns[column].desc(), columns[key]).limit(limit)
+
+
+REPORTS = {
+    "best sellers": (
+        lambda db: db.execute(top(analytics.item_sales_scan(), "quantity", "item_id")).all(),
+        lambda db: db.query(ItemSalesRollup.item_id, ItemSalesRollup.quantity, ItemSalesRollup.revenue)
+        .order_by(ItemSalesRollup.quantity.desc(), ItemSalesRollup.item_id).limit(10).all(),
+    ),
+    "revenue by hour": (
+        lambda db: db.execute(analytics.hourly_sales_scan()).all(),
+        lambda db: db.query(
+            HourlySalesRollup.hour, HourlySalesRollup.orders, HourlySalesRollup.quantity, HourlySalesRollup.revenue,
+        ).all(),
+    ),
+    "top customers": (
+        lambda db: db.execute(top(analytics.customer_spend_scan(), "revenue", "key")).all(),
+        lambda db: db.query(
+            CustomerSpendRollup.customer_id, CustomerSpendRollup.orders,
+            CustomerSpendRollup.quantity, CustomerSpendRollup.revenue,
+        ).order_by(CustomerSpendRollup.revenue.desc(), CustomerSpendRollup.customer_id).limit(10).all(),
+    ),
+}
+
+
+# Every row of each rollup next to the full scan it must match.
+FULL_REPORTS = {
+    "item sales": (
+        lambda db: db.execute(analytics.item_sales_scan()).all(),
+        lambda db: db.query(ItemSalesRollup.item_id, ItemSalesRollup.quantity, ItemSalesRollup.revenue).all(),
+    ),
+    "revenue by hour": REPORTS["revenue by hour"],
+    "customer spend": (
+        lambda db: db.execute(analytics.customer_spend_scan()).all(),
+        lambda db: db.query(
+            CustomerSpendRollup.customer_id, CustomerSpendRollup.orders,
+            CustomerSpendRollup.quantity, CustomerSpendRollup.revenue,
+        ).all(),
+    ),
+}
+
+
+def normalize(rows):
+    rows = (tuple(round(value, 6) if isinstance(value, float) else value for value in row) for row in rows)
+    # Rollup rows whose orders were all deleted stay behind as zeros; the scans have no row for them.
+    return sorted(row for row in rows if any(row[1:]))
+
+
+def change_orders(client, timestamp):
+    """Place, reprice, move and delete orders through the API so the rollups are updated incrementally."""
+    def order(customer_id, ts, items):
+        return {"customer_id": customer_id, "timestamp": ts, "items": [
+            {"item_id": item_id, "quantity": quantity} for item_id, quantity in items
+        ]}
+
+    def check(response):
+        assert response.status_code in (200, 204), (response.status_code, response.text)
+        return response
+
+    single = check(client.post("/orders/", json=order(1, timestamp, [(1, 2), (2, 1)]))).json()["id"]
+    bulk = check(client.post("/orders/bulk", json=[order(2, timestamp + 3600, [(1, 1), (3, 4)])])).json()[0]["id"]
+    check(client.put("/items/1", json={"name": "Dosa 0", "price": 50.0}))
+    check(client.put(f"/orders/{single}", json=order(3, timestamp + 7200, [(1, 2), (2, 1)])))
+    check(client.delete(f"/orders/{single}"))
+    check(client.delete("/items/3"))
+    check(client.delete(f"/orders/{bulk}"))
+    check(client.post("/orders/", json=order(4, timestamp, [(1, 1), (2, 3)])))
+
+
+def run(orders=500_000, repeats=5):
+    seed(orders)
+    db = database.SessionLocal()
+    _, rebuild = timed(analytics.rebuild_rollups, db)
+    print(f"{orders} orders, {2 * orders} order lines; rollup rebuild took {rebuild:.2f}s")
+    print(f"  {'report':16} {'full scan ms':>13} {'rollup ms':>10} {'speedup':>8}")
+    failures = 0
+    for name, (scan, rollup) in REPORTS.items():
+        scan_rows, scan_time = timed(lambda: [scan(db) for _ in range(repeats)][-1])
+        rollup_rows, rollup_time = timed(lambda: [rollup(db) for _ in range(repeats)][-1])
+        if normalize(scan_rows) != normalize(rollup_rows):
+            print(f"FAIL: {name} rollup does not match the full scan")
+            failures += 1
+        scan_ms, rollup_ms = scan_time / repeats * 1000, rollup_time / repeats * 1000
+        print(f"  {name:16} {scan_ms:13.2f} {rollup_ms:10.2f} {scan_ms / rollup_ms:7.0f}x")
+    db.close()
+
+    change_orders(TestClient(main.app), 1_700_000_000)
+    db = database.SessionLocal()
+    for name, (scan, rollup) in FULL_REPORTS.items():
+        if normalize(scan(db)) != normalize(rollup(db)):
+            print(f"FAIL: {name} rollup does not match the full scan after incremental changes")
+            failures += 1
+    db.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(*(int(arg) for arg in sys.argv[1:3])))
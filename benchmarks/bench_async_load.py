@@ -0,0 +1,86 @@
+"""Load-test the CRUD endpoints in sync and async DB_MODE and compare them.
+
+Each mode runs in its own subprocess, in-process against a local SQLite file,
+with `concurrency` clients issuing a read-heavy mix of requests through an
+ASGI transport (sync routes still go through FastAPI's threadpool).
+
+Usage: python benchmarks/bench_async_load.py [requests] [concurrency] [development|production]
+Requires httpx.
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import load_app, percentile
+
+
+async def drive(app, total, concurrency, customers=20, items=10):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(customers):
+            await client.post("/customers/", json={"name": f"Customer {i}", "phone": f"555-{i:04d}"})
+        for i in range(items):
+            await client.post("/items/", json={"name": f"Dosa {i}", "price": 5.0 + i})
+        order = {"customer_id": 1, "timestamp": 1_700_000_000, "items": [{"item_id": 1, "quantity": 2}]}
+        await client.post("/orders/", json=order)
+
+        latencies = []
+        errors = 0
+        counter = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for n in counter:
+                kind = n % 5
+                start = time.perf_counter()
+                if kind == 0:
+                    response = await client.post("/orders/", json={**order, "timestamp": order["timestamp"] + n})
+                elif kind in (1, 2):
+                    response = await client.get("/orders/1")
+                else:
+                    response = await client.get(f"/customers/{n % customers + 1}")
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    await app.router.shutdown()
+
+    return {
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rps": total / elapsed,
+        "errors": errors,
+    }
+
+
+def run_mode(profile, mode, total, concurrency):
+    main = load_app(DB_MODE=mode, DB_PROFILE=profile)
+    print(json.dumps(asyncio.run(drive(main.app, total, concurrency))))
+
+
+def run(total=1000, concurrency=20, profile="development"):
+    print(f"{total} requests, {concurrency} concurrent clients, {profile} profile")
+    print(f"  {'mode':6} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7}")
+    for mode in ("sync", "async"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", profile, mode, str(total), str(concurrency)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"  {mode:6} {result['p50_ms']:9.2f} {result['p99_ms']:9.2f} {result['rps']:9.1f} {result['errors']:7d}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--mode"]:
+        run_mode(sys.argv[2], sys.argv[3], *(int(arg) for arg in sys.argv[4:6]))
+    else:
+        run(*(int(arg) for arg in sys.argv[1:3]), *sys.argv[3:4])
@@ -0,0 +1,63 @@
+"""Compare `POST /orders/` one order at a time against `POST /orders/bulk`.
+
+Usage: python benchmarks/bench_bulk_orders.py [orders] [items_per_order]
+"""
+
+import sys
+
+from common import load_app, timed
+
+main = load_app()
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+def seed(client, customers=50, items=30):
+    for i in range(customers):
+        client.post("/customers/", json={"name": f"Customer {i}", "phone": f"555-{i:04d}"})
+    for i in range(items):
+        client.post("/items/", json={"name": f"Dosa {i}", "price": 5.0 + i})
+    return customers, items
+
+
+def make_orders(count, items_per_order, customers, items):
+    return [
+        {
+            "customer_id": n % customers + 1,
+            "timestamp": 1_700_000_000 + n,
+            "notes": None,
+            "items": [
+                {"item_id": (n + k) % items + 1, "quantity": k + 1} for k in range(items_per_order)
+            ],
+        }
+        for n in range(count)
+    ]
+
+
+def run_single(client, orders):
+    for order in orders:
+        assert client.post("/orders/", json=order).status_code == 200
+
+
+def run_bulk(client, orders):
+    response = client.post("/orders/bulk", json=orders)
+    assert response.status_code == 200
+    assert all(result["status"] == "created" for result in response.json())
+
+
+def run(count=500, items_per_order=3):
+    client = TestClient(main.app)
+    customers, items = seed(client)
+    orders = make_orders(count, items_per_order, customers, items)
+
+    _, single = timed(run_single, client, orders)
+    _, bulk = timed(run_bulk, client, orders)
+
+    print(f"{count} orders x {items_per_order} items")
+    print(f"  single POST /orders/    : {single:8.3f}s  {count / single:10.1f} orders/s")
+    print(f"  bulk   POST /orders/bulk: {bulk:8.3f}s  {count / bulk:10.1f} orders/s")
+    print(f"  speedup                 : {single / bulk:8.1f}x")
+
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:3]))
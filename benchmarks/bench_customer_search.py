@@ -0,0 +1,120 @@
+"""Time customer lookup by phone and typeahead search on a large synthetic table.
+
+Loads `customers` synthetic customers with bulk inserts, fills the search index
+with `rebuild_search_index`, then times the endpoints for exact phone lookups,
+phone prefixes and name prefixes of one to several characters. The script exits
+non-zero if any result does not match its query.
+
+Usage: python benchmarks/bench_customer_search.py [customers] [lookups]
+"""
+
+import asyncio
+import random
+import sys
+import time
+
+from common import asgi_request, load_app, percentile, timed
+
+main = load_app(DB_PROFILE="production")
+
+import orjson  # noqa: E402
+
+import database  # noqa: E402
+from customer_search import rebuild_search_index  # noqa: E402
+from models import Customer  # noqa: E402
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Anika", "Arjun", "Deepa", "Divya", "Ganesh", "Isha", "Karthik", "Kavya", "Lakshmi", "Manoj",
+    "Meera", "Nikhil", "Padma", "Pooja", "Priya", "Rahul", "Ravi", "Sanjay", "Shreya", "Suresh", "Tara", "Vikram",
+]
+LAST_NAMES = [
+    "Bhat", "Chandran", "Desai", "Gupta", "Iyer", "Joshi", "Kumar", "Menon", "Nair", "Pillai", "Rao", "Reddy",
+    "Shah", "Sharma", "Subramanian", "Venkatesh",
+]
+SEED_BATCH = 50_000
+
+
+def phone(n):
+    return f"555-{n:07d}"
+
+
+def seed(customers):
+    rng = random.Random(42)
+    db = database.SessionLocal()
+    try:
+        for start in range(0, customers, SEED_BATCH):
+            db.execute(Customer.__table__.insert(), [
+                {"id": n + 1, "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {n}", "phone": phone(n)}
+                for n in range(start, min(start + SEED_BATCH, customers))
+            ])
+        db.commit()
+        rebuild_search_index(db)
+    finally:
+        db.close()
+
+
+async def get(path, query_string=""):
+    start = time.perf_counter()
+    status, body = await asgi_request(main.app, "GET", path, query_string)
+    return status, orjson.loads(body), time.perf_counter() - start
+
+
+def name_matches(customer, q):
+    words = customer["name"].lower().split()
+    return all(any(word.startswith(term) for word in words) for term in q.lower().split())
+
+
+async def drive(customers, lookups):
+    rng = random.Random(7)
+    failures = []
+    cases = {
+        "by phone": [(f"/customers/by-phone/{phone(rng.randrange(customers))}", "") for _ in range(lookups)],
+        "phone prefix": [("/customers/search", f"q={phone(rng.randrange(customers))[:8]}") for _ in range(lookups)],
+    }
+    for length in (1, 2, 3, 5):
+        cases[f"name prefix {length}"] = [
+            ("/customers/search", f"q={rng.choice(FIRST_NAMES + LAST_NAMES)[:length]}") for _ in range(lookups)
+        ]
+    cases["two words"] = [
+        ("/customers/search", f"q={rng.choice(FIRST_NAMES)}+{rng.choice(LAST_NAMES)[:2]}") for _ in range(lookups)
+    ]
+
+    results = {}
+    for name, requests in cases.items():
+        latencies = []
+        for path, query_string in requests:
+            status, body, elapsed = await get(path, query_string)
+            latencies.append(elapsed)
+            if status != 200:
+                failures.append(f"{path}?{query_string} returned {status}")
+            elif path.startswith("/customers/by-phone/"):
+                if body["phone"] != path.rsplit("/", 1)[1]:
+                    failures.append(f"{path} returned {body['phone']}")
+            else:
+                q = query_string[2:].replace("+", " ")
+                if not body:
+                    failures.append(f"search for {q!r} found nothing")
+                for customer in body:
+                    if not (customer["phone"].startswith(q) if q[0].isdigit() else name_matches(customer, q)):
+                        failures.append(f"search for {q!r} returned {customer}")
+        results[name] = latencies
+    return results, failures
+
+
+def run(customers=1_000_000, lookups=200):
+    _, elapsed = timed(seed, customers)
+    print(f"seeded {customers} customers and the search index in {elapsed:.1f} s")
+    results, failures = asyncio.run(drive(customers, lookups))
+
+    print(f"{lookups} requests per case through the app, limit 10")
+    for name, latencies in results.items():
+        p50, p99 = percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000
+        print(f"  {name:14} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+
+    for failure in failures[:20]:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(*(int(arg) for arg in sys.argv[1:3])))
@@ -0,0 +1,124 @@
+"""Check and time idempotent order submission in sync and async DB_MODE.
+
+Each mode runs in its own subprocess. Bursts of concurrent retries share one
+`Idempotency-Key` and must produce exactly one order and identical responses; a
+key reused with a different body must be rejected, and expired keys must be
+purged. It then compares the latency of replays served from the in-memory LRU,
+replays read from the idempotency table and fresh order creation. The script
+exits non-zero if any check fails.
+
+Usage: python benchmarks/bench_idempotency.py [keys] [concurrency] [requests]
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import asgi_request, load_app, percentile
+
+ORDER = {"customer_id": 1, "timestamp": 1_700_000_000, "items": [{"item_id": 1, "quantity": 2}]}
+
+
+def post_order(app, key, order=ORDER):
+    headers = [] if key is None else [(b"idempotency-key", key.encode())]
+    return asgi_request(app, "POST", "/orders/", body=json.dumps(order).encode(), headers=headers)
+
+
+async def drive(app, keys, concurrency, total):
+    import database
+    import idempotency
+    from models import IdempotencyKey, Order
+
+    def count(model):
+        db = database.SessionLocal()
+        try:
+            return db.query(model).count()
+        finally:
+            db.close()
+
+    await asgi_request(app, "POST", "/customers/", body=b'{"name": "Customer", "phone": "555-0000"}')
+    await asgi_request(app, "POST", "/items/", body=b'{"name": "Dosa", "price": 5.0}')
+    failures = []
+
+    for n in range(keys):
+        responses = await asyncio.gather(*(post_order(app, f"retry-{n}") for _ in range(concurrency)))
+        if {status for status, _ in responses} != {200} or len({body for _, body in responses}) != 1:
+            failures.append(f"key retry-{n}: retries got different responses")
+    if count(Order) != keys:
+        failures.append(f"{keys * concurrency} concurrent retries of {keys} keys created {count(Order)} orders")
+
+    status, _ = await post_order(app, "retry-0", {**ORDER, "notes": "changed"})
+    if status != 422:
+        failures.append(f"reusing a key with a different body returned {status}, not 422")
+
+    async def latencies(key_for, before=None):
+        values = []
+        for n in range(total):
+            if before is not None:
+                before()
+            start = time.perf_counter()
+            status, _ = await post_order(app, key_for(n))
+            values.append(time.perf_counter() - start)
+            assert status == 200, status
+        return values
+
+    results = {
+        "LRU replay": await latencies(lambda n: "retry-0"),
+        "table replay": await latencies(lambda n: "retry-0", idempotency.store.clear),
+        "new key": await latencies(lambda n: f"new-{n}"),
+        "no key": await latencies(lambda n: None),
+    }
+
+    stored = count(IdempotencyKey)
+    clock = idempotency.store.clock
+    idempotency.store.clock = lambda: clock() + idempotency.IDEMPOTENCY_TTL + 1
+    try:
+        db = database.SessionLocal()
+        try:
+            removed = idempotency.purge_expired(db)
+        finally:
+            db.close()
+    finally:
+        idempotency.store.clock = clock
+    if removed != stored or count(IdempotencyKey):
+        failures.append(f"purge removed {removed} of {stored} expired keys")
+
+    await app.router.shutdown()
+    return {
+        "latency": {name: [percentile(values, 0.5) * 1000, percentile(values, 0.99) * 1000]
+                    for name, values in results.items()},
+        "failures": failures,
+    }
+
+
+def run_mode(mode, keys, concurrency, total):
+    main = load_app(DB_MODE=mode, DB_PROFILE="production")
+    print(json.dumps(asyncio.run(drive(main.app, keys, concurrency, total))))
+
+
+def run(keys=20, concurrency=16, total=500):
+    failures = []
+    for mode in ("sync", "async"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, str(keys), str(concurrency), str(total)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode}: {keys} keys x {concurrency} concurrent retries, {total} requests per path")
+        for name, (p50, p99) in result["latency"].items():
+            print(f"  {name:14} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+        failures.extend(f"{mode}: {failure}" for failure in result["failures"])
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--mode"]:
+        run_mode(sys.argv[2], *(int(arg) for arg in sys.argv[3:6]))
+    else:
+        sys.exit(run(*(int(arg) for arg in sys.argv[1:4])))
@@ -0,0 +1,73 @@
+"""Measure the per-request cost of the metrics hooks.
+
+Runs the same request mix in subprocesses with METRICS_ENABLED=0, with
+metrics enabled, and with the slow-request log collecting statements, calling
+the ASGI app directly so no HTTP client time is included.
+
+Usage: python benchmarks/bench_metrics_overhead.py [requests] [rounds]
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import asgi_request, load_app
+
+VARIANTS = {
+    "disabled": {"METRICS_ENABLED": "0"},
+    "enabled": {"METRICS_ENABLED": "1"},
+    "enabled + slow log": {"METRICS_ENABLED": "1", "SLOW_REQUEST_MS": "60000"},
+}
+PATHS = ("/", "/items/1", "/orders/1", "/customers/1")
+
+
+async def drive(app, total, rounds):
+    await asgi_request(app, "POST", "/customers/", body=b'{"name": "Customer", "phone": "555-0000"}')
+    await asgi_request(app, "POST", "/items/", body=b'{"name": "Dosa", "price": 5.0}')
+    await asgi_request(app, "POST", "/orders/", body=(
+        b'{"customer_id": 1, "timestamp": 1700000000, "items": [{"item_id": 1, "quantity": 2}]}'
+    ))
+    results = {}
+    for path in PATHS:
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(total):
+                status, _ = await asgi_request(app, "GET", path)
+                assert status == 200, (path, status)
+            elapsed = (time.perf_counter() - start) / total
+            best = elapsed if best is None else min(best, elapsed)
+        results[path] = best * 1_000_000
+    return results
+
+
+def run_variant(name, total, rounds):
+    main = load_app(**VARIANTS[name])
+    print(json.dumps(asyncio.run(drive(main.app, total, rounds))))
+
+
+def run(total=1000, rounds=3):
+    results = {}
+    for name in VARIANTS:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--variant", name, str(total), str(rounds)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"best of {rounds} rounds x {total} requests, microseconds per request")
+    print(f"  {'path':14}" + "".join(f"{name:>20}" for name in VARIANTS) + f"{'overhead':>10}")
+    for path in PATHS:
+        disabled, enabled = results["disabled"][path], results["enabled"][path]
+        row = "".join(f"{results[name][path]:20.1f}" for name in VARIANTS)
+        print(f"  {path:14}{row}{enabled - disabled:+10.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--variant"]:
+        run_variant(sys.argv[2], *(int(arg) for arg in sys.argv[3:5]))
+    else:
+        run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,112 @@
+"""Export a large synthetic order history and check memory and time to first byte.
+
+The app is driven directly over ASGI so the response body is consumed chunk by
+chunk instead of being buffered by a test client. Resident memory is sampled
+while streaming; the script exits non-zero if it grows by more than
+`MAX_RSS_GROWTH_MB`, so it can be run as a check. Linux only (reads /proc).
+
+Usage: python benchmarks/bench_order_export.py [orders] [ndjson|csv]
+"""
+
+import asyncio
+import sys
+import time
+
+from common import load_app
+
+main = load_app()
+
+import database  # noqa: E402
+from models import Customer, Item, Order, OrderItem  # noqa: E402
+
+MAX_RSS_GROWTH_MB = 64
+SEED_BATCH = 10_000
+
+
+def rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def seed(orders, customers=1000, items=20):
+    with database.engine.begin() as conn:
+        conn.execute(Customer.__table__.insert(), [
+            {"name": f"Customer {i}", "phone": f"555-{i:06d}"} for i in range(customers)
+        ])
+        conn.execute(Item.__table__.insert(), [{"name": f"Dosa {i}", "price": 5.0 + i} for i in range(items)])
+        for start in range(0, orders, SEED_BATCH):
+            ids = range(start + 1, min(orders, start + SEED_BATCH) + 1)
+            conn.execute(Order.__table__.insert(), [
+                {"id": n, "customer_id": n % customers + 1, "timestamp": 1_700_000_000 + n, "notes": "extra chutney"}
+                for n in ids
+            ])
+            conn.execute(OrderItem.__table__.insert(), [
+                {"order_id": n, "item_id": n % items + k + 1, "quantity": k + 1} for n in ids for k in range(2)
+            ])
+
+
+async def stream(app, query_string):
+    """Run one GET /orders/export and return (status, bytes, ttfb, total, peak_rss)."""
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/orders/export", "raw_path": b"/orders/export", "root_path": "",
+        "query_string": query_string.encode(), "headers": [],
+        "server": ("bench", 80), "client": ("bench", 50000),
+    }
+    done = asyncio.Event()
+    request_sent = False
+    state = {"status": None, "bytes": 0, "first": None, "chunks": 0, "peak": rss_mb()}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            state["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            if state["first"] is None:
+                state["first"] = time.perf_counter()
+            state["bytes"] += len(message.get("body", b""))
+            state["chunks"] += 1
+            if state["chunks"] % 50 == 0:
+                state["peak"] = max(state["peak"], rss_mb())
+            if not message.get("more_body", False):
+                done.set()
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    end = time.perf_counter()
+    state["peak"] = max(state["peak"], rss_mb())
+    return state["status"], state["bytes"], state["first"] - start, end - start, state["peak"]
+
+
+def run(orders=300_000, fmt="ndjson"):
+    seed(orders)
+    baseline = rss_mb()
+    query = f"from=0&to={2_000_000_000}&format={fmt}"
+    status, size, ttfb, total, peak = asyncio.run(stream(main.app, query))
+    assert status == 200, status
+
+    growth = peak - baseline
+    print(f"exported {orders} orders ({2 * orders} rows) as {fmt}")
+    print(f"  size            : {size / 1024 / 1024:8.1f} MiB")
+    print(f"  time to 1st byte: {ttfb * 1000:8.1f} ms")
+    print(f"  total time      : {total:8.2f} s  ({2 * orders / total:,.0f} rows/s)")
+    print(f"  RSS             : {baseline:8.1f} MiB before, {peak:8.1f} MiB peak (+{growth:.1f})")
+    if growth > MAX_RSS_GROWTH_MB:
+        print(f"FAIL: RSS grew by {growth:.1f} MiB (limit {MAX_RSS_GROWTH_MB})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:3]
+    sys.exit(run(*(int(args[0]),) if args else (), *args[1:2]))
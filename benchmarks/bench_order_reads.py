@@ -0,0 +1,102 @@
+"""Count SQL statements and time the order read endpoints.
+
+The eager read path must use a fixed number of statements no matter how many
+line items an order has; the script exits non-zero if that regresses, so it
+can be run as a check. A lazy-loading baseline is shown for comparison.
+
+Usage: python benchmarks/bench_order_reads.py [orders] [items_per_order]
+"""
+
+import sys
+
+from common import load_app, timed
+
+main = load_app()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import database  # noqa: E402
+from models import Order  # noqa: E402
+from schemas import OrderResponse  # noqa: E402
+
+# SELECT orders, SELECT order_items, SELECT items
+MAX_STATEMENTS_PER_READ = 3
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def measure(self, fn, *args, **kwargs):
+        self.count = 0
+        result, elapsed = timed(fn, *args, **kwargs)
+        return result, elapsed, self.count
+
+
+def seed(client, orders, items_per_order):
+    client.post("/customers/", json={"name": "Customer", "phone": "555-0000"})
+    for i in range(items_per_order):
+        client.post("/items/", json={"name": f"Dosa {i}", "price": 5.0 + i})
+    payload = [
+        {
+            "customer_id": 1,
+            "timestamp": 1_700_000_000 + n,
+            "items": [{"item_id": k + 1, "quantity": 1} for k in range(items_per_order)],
+        }
+        for n in range(orders)
+    ]
+    client.post("/orders/bulk", json=payload)
+
+
+def lazy_read(order_id):
+    db = database.SessionLocal()
+    try:
+        return OrderResponse.from_orm(db.query(Order).filter(Order.id == order_id).first()).dict()
+    finally:
+        db.close()
+
+
+def run(orders=200, items_per_order=10, page_size=50):
+    client = TestClient(main.app)
+    seed(client, orders, items_per_order)
+    counter = StatementCounter(database.engine)
+    failures = []
+
+    _, lazy_elapsed, lazy_count = counter.measure(lazy_read, 1)
+    response, eager_elapsed, eager_count = counter.measure(client.get, "/orders/1")
+    assert response.status_code == 200 and len(response.json()["items"]) == items_per_order
+    if eager_count > MAX_STATEMENTS_PER_READ:
+        failures.append(f"GET /orders/{{id}} ran {eager_count} statements")
+
+    print(f"single order with {items_per_order} items")
+    print(f"  lazy loading    : {lazy_count:4d} statements  {lazy_elapsed * 1000:8.2f} ms")
+    print(f"  GET /orders/{{id}}: {eager_count:4d} statements  {eager_elapsed * 1000:8.2f} ms")
+
+    after_id, pages, total = None, 0, 0
+    while True:
+        params = {"limit": page_size}
+        if after_id is not None:
+            params["after_id"] = after_id
+        response, elapsed, count = counter.measure(client.get, "/orders/", params=params)
+        page = response.json()
+        if count > MAX_STATEMENTS_PER_READ:
+            failures.append(f"GET /orders/ page {pages} ran {count} statements")
+        pages += 1
+        total += elapsed
+        after_id = page["next_after_id"]
+        if after_id is None:
+            break
+    print(f"GET /orders/ in {pages} pages of {page_size}: {total / pages * 1000:8.2f} ms/page")
+
+    for failure in failures:
+        print(f"FAIL: {failure} (limit {MAX_STATEMENTS_PER_READ})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(*(int(arg) for arg in sys.argv[1:4])))
@@ -0,0 +1,206 @@
+"""Connect hundreds of local subscribers to `GET /orders/stream` and measure delivery.
+
+Subscribers are driven straight through the ASGI app. The script reports
+memory per connected subscriber, measured with tracemalloc. It then creates
+orders and reports the latency from commit to arrival at every subscriber. It
+also checks that a reconnecting client resumes from `Last-Event-ID`, that one
+bulk order larger than the replay buffer reaches every subscriber without
+disconnecting any, and that a stalled client is cut off without holding up
+publishing, then catches up by resuming. The script exits non-zero if any check fails.
+
+Usage: python benchmarks/bench_order_stream.py [subscribers] [events] [sync|async]
+"""
+
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+from common import asgi_request, load_app, percentile
+
+MODE = sys.argv[3] if len(sys.argv) > 3 else "sync"
+main = load_app(DB_MODE=MODE, DB_PROFILE="production")
+
+import order_events  # noqa: E402
+
+bus = order_events.bus
+ORDER = {"customer_id": 1, "timestamp": 1_700_000_000, "items": [{"item_id": 1, "quantity": 2}]}
+
+
+class StreamClient:
+    """One SSE subscriber that records when each event id arrives."""
+
+    def __init__(self, last_event_id=None, paused=False):
+        self.last_event_id = last_event_id
+        self.arrivals = {}
+        self.types = {}
+        self.resets = 0
+        self.buffer = b""
+        self.disconnect = asyncio.Event()
+        self.resume = asyncio.Event()
+        if not paused:
+            self.resume.set()
+        self.task = asyncio.ensure_future(self.run())
+
+    @property
+    def last_id(self):
+        return max(self.arrivals, default=self.last_event_id)
+
+    async def run(self):
+        headers = [] if self.last_event_id is None else [(b"last-event-id", str(self.last_event_id).encode())]
+        scope = {
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/orders/stream", "raw_path": b"/orders/stream", "root_path": "", "query_string": b"",
+            "headers": headers, "server": ("bench", 80), "client": ("bench", 50000),
+        }
+
+        async def receive():
+            await self.disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        await main.app(scope, receive, self.send)
+
+    async def send(self, message):
+        if message["type"] != "http.response.body":
+            return
+        await self.resume.wait()
+        now = time.perf_counter()
+        self.buffer += message.get("body", b"")
+        while b"\n\n" in self.buffer:
+            frame, self.buffer = self.buffer.split(b"\n\n", 1)
+            fields = dict(line.split(b": ", 1) for line in frame.split(b"\n") if b": " in line and line[:1] != b":")
+            if fields.get(b"event") == b"reset":
+                self.resets += 1
+            elif b"id" in fields:
+                self.arrivals[int(fields[b"id"])] = now
+                self.types[int(fields[b"id"])] = fields[b"event"].decode()
+
+    async def close(self):
+        self.disconnect.set()
+        await self.task
+
+
+async def wait_for(condition, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+async def post_orders(count):
+    ids = []
+    for n in range(count):
+        status, body = await asgi_request(main.app, "POST", "/orders/", body=json.dumps(
+            {**ORDER, "timestamp": ORDER["timestamp"] + n}
+        ).encode())
+        assert status == 200, status
+        ids.append(json.loads(body)["id"])
+    return ids
+
+
+async def drive(subscribers, events):
+    failures = []
+    await asgi_request(main.app, "POST", "/customers/", body=b'{"name": "Kitchen", "phone": "555-0000"}')
+    await asgi_request(main.app, "POST", "/items/", body=b'{"name": "Dosa", "price": 5.0}')
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    clients = [StreamClient() for _ in range(subscribers)]
+    await wait_for(lambda: bus.subscriber_count == subscribers)
+    await asyncio.sleep(0.1)
+    allocated = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    tracemalloc.stop()
+    print(f"{subscribers} subscribers ({MODE} mode): {allocated / subscribers / 1024:.1f} KiB allocated per subscriber")
+
+    first_id = bus.publish("ping", b"{}").id + 1
+    await wait_for(lambda: all(c.last_id == first_id - 1 for c in clients))
+    start = time.perf_counter()
+    await post_orders(events)
+    last_id = first_id + events - 1
+    if not await wait_for(lambda: all(c.last_id == last_id for c in clients)):
+        failures.append("not every subscriber received every event")
+    elapsed = time.perf_counter() - start
+
+    published = {e.id: e.published_at for e in bus._history if e.id >= first_id}
+    latencies = [
+        client.arrivals[event_id] - published[event_id]
+        for client in clients for event_id in range(first_id, last_id + 1) if event_id in client.arrivals
+    ]
+    print(f"{events} orders in {elapsed:.2f} s, {len(latencies)} deliveries")
+    print(f"  commit to arrival  p50 {percentile(latencies, 0.5) * 1000:7.2f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms   max {max(latencies) * 1000:7.2f} ms")
+    if any(list(c.arrivals) != sorted(c.arrivals) for c in clients):
+        failures.append("events arrived out of order")
+
+    # A client that disconnects resumes where it stopped.
+    leaving = clients.pop()
+    await leaving.close()
+    resume_from = leaving.last_id
+    await asgi_request(main.app, "PUT", "/orders/1", body=json.dumps({**ORDER, "notes": "extra chutney"}).encode())
+    await asgi_request(main.app, "DELETE", f"/orders/{events}")
+    resumed = StreamClient(last_event_id=resume_from)
+    await wait_for(lambda: resumed.last_id == resume_from + 2)
+    if [resumed.types.get(resume_from + 1), resumed.types.get(resume_from + 2)] != ["order.updated", "order.deleted"]:
+        failures.append(f"resuming from {resume_from} replayed {resumed.types}")
+    clients.append(resumed)
+
+    # A bulk order is one commit, so it is not mistaken for a slow consumer even past the replay buffer.
+    bulk_size = bus._history.maxlen + bus.queue_size
+    bulk_from = bus._next_id
+    start = time.perf_counter()
+    status, _ = await asgi_request(main.app, "POST", "/orders/bulk", body=json.dumps([
+        {**ORDER, "timestamp": ORDER["timestamp"] + n} for n in range(bulk_size)
+    ]).encode())
+    assert status == 200, status
+    bulk_ids = set(range(bulk_from, bulk_from + bulk_size))
+    if not await wait_for(lambda: all(bulk_ids <= c.arrivals.keys() for c in clients)):
+        failures.append("a bulk order did not reach every subscriber")
+    print(f"bulk order of {bulk_size} delivered to every subscriber in {time.perf_counter() - start:.2f} s")
+    if bus.subscriber_count != len(clients) or any(c.resets for c in clients):
+        failures.append("a bulk order disconnected subscribers")
+
+    # A stalled client overflows its queue and is dropped without slowing the others down.
+    stalled = StreamClient(paused=True)
+    await wait_for(lambda: bus.subscriber_count == len(clients) + 1)
+    stalled_from = bus._next_id - 1
+    await post_orders(bus.queue_size + 5)
+    newest = bus._next_id - 1
+    if not await wait_for(lambda: all(c.last_id == newest for c in clients)):
+        failures.append("a stalled subscriber held up delivery to the others")
+    if bus.subscriber_count != len(clients):
+        failures.append("the stalled subscriber was not cut off")
+    stalled.resume.set()
+    try:
+        await asyncio.wait_for(stalled.task, 10)
+    except asyncio.TimeoutError:
+        failures.append("the stalled subscriber's stream did not end after draining")
+    caught_up = StreamClient(last_event_id=stalled.last_id)
+    await wait_for(lambda: caught_up.last_id == newest)
+    if sorted({**stalled.arrivals, **caught_up.arrivals}) != list(range(stalled_from + 1, newest + 1)):
+        failures.append("the stalled subscriber did not catch up by resuming")
+    clients.append(caught_up)
+
+    # A client resuming from an id this process never issued, e.g. after a restart, is told to reload.
+    restarted = StreamClient(last_event_id=newest + 1000)
+    if not await wait_for(lambda: restarted.resets == 1, timeout=5):
+        failures.append("resuming from an unknown event id did not send a reset")
+    clients.append(restarted)
+
+    for client in clients:
+        await client.close()
+    await main.app.router.shutdown()
+    return failures
+
+
+def run(subscribers=500, events=200):
+    failures = asyncio.run(drive(subscribers, events))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(*(int(arg) for arg in sys.argv[1:3])))
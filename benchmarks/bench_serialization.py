@@ -0,0 +1,116 @@
+"""Compare the validated response path with the fast serialization path.
+
+For a single order and for pages of orders, times turning already-loaded data
+into a response body: ORM objects validated against the response model and
+encoded the way FastAPI does it, versus plain dicts built from rows and encoded
+with orjson. It then times the endpoints end to end. The script exits non-zero
+if the two paths produce different JSON, so it can be run as a check.
+
+Usage: python benchmarks/bench_serialization.py [orders] [items_per_order] [repeat]
+"""
+
+import asyncio
+import json
+import sys
+
+from common import asgi_request, load_app, timed
+
+main = load_app()
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy.orm import selectinload  # noqa: E402
+
+import database  # noqa: E402
+import serializers  # noqa: E402
+from models import Customer, Order, OrderItem  # noqa: E402
+from schemas import CustomerResponse, OrderResponse  # noqa: E402
+
+
+def seed(client, orders, items_per_order):
+    client.post("/customers/", json={"name": "Customer", "phone": "555-0000"})
+    for i in range(items_per_order):
+        client.post("/items/", json={"name": f"Dosa {i}", "price": 5.0 + i})
+    payload = [
+        {
+            "customer_id": 1,
+            "timestamp": 1_700_000_000 + n,
+            "notes": f"order {n}",
+            "items": [{"item_id": k + 1, "quantity": 1 + (n + k) % 3} for k in range(items_per_order)],
+        }
+        for n in range(orders)
+    ]
+    client.post("/orders/bulk", json=payload)
+
+
+def validated_body(model, objects):
+    """What FastAPI does with a returned ORM object: validate, jsonable_encoder, json.dumps."""
+    if isinstance(objects, list):
+        content = [model.validate(obj) for obj in objects]
+    else:
+        content = model.validate(objects)
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_body(content):
+    return ORJSONResponse(content).body
+
+
+def best_of(repeat, fn, *args):
+    return min(timed(fn, *args)[1] for _ in range(repeat))
+
+
+def run(orders=500, items_per_order=10, repeat=20):
+    client = TestClient(main.app)
+    seed(client, orders, items_per_order)
+    failures = []
+
+    db = database.SessionLocal()
+    try:
+        customer = db.query(Customer).first()
+        customer_row = db.execute(serializers.customer_query(customer.id)).first()
+        order_objects = (
+            db.query(Order).options(selectinload(Order.items).selectinload(OrderItem.item)).order_by(Order.id).all()
+        )
+        order_rows = db.execute(serializers.orders_query().order_by(Order.id)).all()
+        line_rows = db.execute(serializers.lines_query(row.id for row in order_rows)).all()
+    finally:
+        db.close()
+
+    first_lines = [line for line in line_rows if line.order_id == order_rows[0].id]
+    cases = [
+        ("customer", CustomerResponse, customer, lambda: serializers.customer_dict(customer_row)),
+        ("order", OrderResponse, order_objects[0], lambda: serializers.order_dicts(order_rows[:1], first_lines)[0]),
+        (f"{orders} orders", OrderResponse, order_objects, lambda: serializers.order_dicts(order_rows, line_rows)),
+    ]
+    print(f"encode already-loaded data, best of {repeat}, {items_per_order} items per order")
+    print(f"  {'payload':14}{'validated':>14}{'fast':>14}{'speedup':>10}")
+    for name, model, objects, build in cases:
+        if json.loads(validated_body(model, objects)) != json.loads(fast_body(build())):
+            failures.append(f"{name}: fast path JSON differs from the response model")
+        slow = best_of(repeat, validated_body, model, objects)
+        fast = best_of(repeat, lambda: fast_body(build()))
+        print(f"  {name:14}{slow * 1000:11.3f} ms{fast * 1000:11.3f} ms{slow / fast:9.1f}x")
+
+    async def endpoint(path, query_string=""):
+        status, body = await asgi_request(main.app, "GET", path, query_string)
+        assert status == 200, (path, status)
+        return body
+
+    def request(path, query_string=""):
+        return asyncio.run(endpoint(path, query_string))
+
+    print(f"end to end through the app, best of {repeat}")
+    for path, query_string in (("/customers/1", ""), ("/orders/1", ""), ("/orders/", f"limit={min(orders, 500)}")):
+        elapsed = best_of(repeat, request, path, query_string)
+        label = path + ("?" + query_string if query_string else "")
+        print(f"  GET {label:24}{elapsed * 1000:9.3f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(*(int(arg) for arg in sys.argv[1:4])))
@@ -0,0 +1,101 @@
+"""Compare write throughput and lookups between the development and production profiles.
+
+"development" runs with the schema as it was before the foreign-key and
+timestamp indexes were added; "production" uses DB_PROFILE=production (WAL,
+pragmas, pooled connections) with the indexes. Each runs in its own
+subprocess against a local SQLite file.
+
+Usage: python benchmarks/bench_sqlite_profile.py [writers] [orders_per_writer] [seed_orders]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from common import load_app
+
+NEW_INDEXES = ("ix_orders_customer_id", "ix_orders_timestamp", "ix_order_items_item_id")
+
+
+def run_profile(profile, writers, orders_per_writer, seed_orders, customers=2000):
+    load_app(DB_PROFILE=profile)
+    import database
+    from models import Customer, Item, Order, OrderItem
+    from sqlalchemy import text
+
+    with database.engine.begin() as conn:
+        if profile == "development":
+            for name in NEW_INDEXES:
+                conn.execute(text(f"DROP INDEX {name}"))
+        conn.execute(Customer.__table__.insert(), [
+            {"name": f"Customer {i}", "phone": f"555-{i:06d}"} for i in range(customers)
+        ])
+        conn.execute(Item.__table__.insert(), [{"name": f"Dosa {i}", "price": 5.0 + i} for i in range(20)])
+        conn.execute(Order.__table__.insert(), [
+            {"customer_id": n % customers + 1, "timestamp": 1_700_000_000 + n} for n in range(seed_orders)
+        ])
+        conn.execute(OrderItem.__table__.insert(), [
+            {"order_id": n + 1, "item_id": n % 20 + 1, "quantity": 1} for n in range(seed_orders)
+        ])
+
+    errors = []
+
+    def writer(worker):
+        for n in range(orders_per_writer):
+            db = database.SessionLocal()
+            try:
+                order = Order(customer_id=worker + 1, timestamp=1_800_000_000 + n)
+                order.items.append(OrderItem(item_id=n % 20 + 1, quantity=1))
+                db.add(order)
+                db.commit()
+            except Exception as exc:  # "database is locked" under contention
+                errors.append(type(exc).__name__)
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    write_elapsed = time.perf_counter() - start
+
+    lookups = 500
+    db = database.SessionLocal()
+    start = time.perf_counter()
+    for n in range(lookups):
+        db.query(Order).filter(Order.customer_id == n % customers + 1).all()
+        db.query(OrderItem).filter(OrderItem.item_id == n % 20 + 1).limit(10).all()
+        db.query(Order).filter(Order.timestamp >= 1_700_000_000 + n * 10).order_by(Order.timestamp).limit(10).all()
+    lookup_elapsed = time.perf_counter() - start
+    db.close()
+
+    print(json.dumps({
+        "writes_per_s": (writers * orders_per_writer - len(errors)) / write_elapsed,
+        "write_errors": len(errors),
+        "lookup_ms": lookup_elapsed / lookups * 1000,
+    }))
+
+
+def run(writers=8, orders_per_writer=100, seed_orders=100_000):
+    print(f"{writers} concurrent writers x {orders_per_writer} orders, lookups over {seed_orders} orders")
+    print(f"  {'profile':12} {'writes/s':>9} {'errors':>7} {'lookup ms':>10}")
+    for profile in ("development", "production"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--profile", profile,
+             str(writers), str(orders_per_writer), str(seed_orders)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"  {profile:12} {result['writes_per_s']:9.1f} {result['write_errors']:7d} {result['lookup_ms']:10.3f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--profile"]:
+        run_profile(sys.argv[2], *(int(arg) for arg in sys.argv[3:6]))
+    else:
+        run(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,76 @@
+"""Shared setup for the benchmark scripts.
+
+Each benchmark runs in-process against a throwaway SQLite file so the project
+database is never touched. Import `load_app` before anything from the project.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_app(**env):
+    """Point the app at a fresh temporary database and import it.
+
+    Extra keyword arguments are exported as environment variables before
+    `main` is imported, so benchmarks can select settings read at startup.
+    """
+    workdir = tempfile.mkdtemp(prefix="dosa-bench-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.sqlite")
+    for key, value in env.items():
+        os.environ[key] = str(value)
+    import database
+    import main
+
+    for engine in (database.engine, database.async_engine):
+        if engine is not None:
+            engine.echo = False
+    return main
+
+
+def timed(fn, *args, **kwargs):
+    """Call `fn` and return `(result, elapsed_seconds)`."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    """Return the value at `fraction` (0 to 1) of the way through the sorted `values`."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def asgi_request(app, method, path, query_string="", body=b"", headers=()):
+    """Send one request straight to an ASGI app and return `(status, body)`.
+
+    Skips any HTTP client, so per-request framework overhead can be measured
+    without client noise.
+    """
+    scope = {
+        "type": "http", "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query_string.encode(),
+        "headers": [(b"content-type", b"application/json"), *headers],
+        "server": ("bench", 80), "client": ("bench", 50000),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"status": None, "body": []}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
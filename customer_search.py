@@ -0,0 +1,97 @@
+"""Customer lookup by phone and typeahead search by name or phone prefix.
+
+Phone prefixes are answered by a range scan on the unique index on
+`customers.phone`. Names are indexed in the `customer_search` FTS5 table, with
+prefix indexes so short prefixes of any word in a name are fast. ORM events
+keep the FTS table in sync with `customers` in the same transaction; writes
+that bypass the ORM must call `rebuild_search_index` afterwards.
+"""
+
+import os
+import re
+
+from sqlalchemy import column, event, inspect, select, table, text
+from sqlalchemy.orm import Session
+
+from models import Customer
+
+CUSTOMER_SEARCH_LIMIT = int(os.environ.get('CUSTOMER_SEARCH_LIMIT', 10))
+CUSTOMER_SEARCH_MAX_LIMIT = 100
+
+# rowid is the customer id.
+search_table = table('customer_search', column('rowid'), column('name'))
+
+CREATE_SEARCH_TABLE = "CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5(name, prefix='1 2 3')"
+
+_PHONE_QUERY = re.compile(r'^\+?[\d()\- ]+$')
+
+
+def create_search_index(engine) -> None:
+    """Create the FTS table if it is missing and fill it from `customers`."""
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_search'")
+        ).first()
+        if not exists:
+            connection.execute(text(CREATE_SEARCH_TABLE))
+            connection.execute(text('INSERT INTO customer_search (rowid, name) SELECT id, name FROM customers'))
+
+
+def rebuild_search_index(db: Session) -> None:
+    """Recompute the FTS table from `customers`, e.g. after bulk loading customers."""
+    db.execute(text('DELETE FROM customer_search'))
+    db.execute(text('INSERT INTO customer_search (rowid, name) SELECT id, name FROM customers'))
+    db.commit()
+
+
+@event.listens_for(Customer, 'after_insert')
+def _index_new_customer(mapper, connection, target):
+    connection.execute(search_table.insert().values(rowid=target.id, name=target.name))
+
+
+@event.listens_for(Customer, 'after_update')
+def _reindex_customer(mapper, connection, target):
+    if inspect(target).attrs.name.history.has_changes():
+        connection.execute(
+            search_table.update().where(search_table.c.rowid == target.id).values(name=target.name)
+        )
+
+
+@event.listens_for(Customer, 'after_delete')
+def _unindex_customer(mapper, connection, target):
+    connection.execute(search_table.delete().where(search_table.c.rowid == target.id))
+
+
+def _fts_prefix_query(q: str) -> str:
+    """Match every word of `q` as a prefix, quoted so FTS5 syntax in the input is taken literally."""
+    return ' '.join('"%s"*' % word.replace('"', '""') for word in q.split())
+
+
+def search_query(q: str, limit: int):
+    """Customers whose phone starts with `q` if it looks like a phone number, else whose name words start with it.
+
+    Returns None if `q` has nothing to search for.
+    """
+    q = q.strip()
+    if not q:
+        return None
+    columns = (Customer.name, Customer.phone, Customer.id)
+    if _PHONE_QUERY.match(q):
+        # A range on the unique index; LIKE 'q%' could not use it with the default collation.
+        return (
+            select(*columns)
+            .where(Customer.phone >= q, Customer.phone < q + '\U0010ffff')
+            .order_by(Customer.phone)
+            .limit(limit)
+        )
+    return (
+        select(*columns)
+        .join(search_table, search_table.c.rowid == Customer.id)
+        .where(search_table.c.name.match(_fts_prefix_query(q)))
+        .order_by(search_table.c.rowid)
+        .limit(limit)
+    )
+
+
+def by_phone_query(phone: str):
+    return select(Customer.name, Customer.phone, Customer.id).where(Customer.phone == phone)
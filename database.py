@@ -0,0 +1,99 @@
+"""Database engine and session setup.
+
+`DB_MODE` selects at startup whether the CRUD endpoints run as sync routes on
+FastAPI's threadpool ("sync", the default) or as coroutines on the event loop
+through aiosqlite ("async"). The sync engine always exists; it creates the
+schema and serves the routes that have no async version.
+
+`DB_PROFILE` selects "development" (the default: SQL echo, driver defaults) or
+"production": no echo, pooled connections, and WAL plus the pragmas below set
+on every new SQLite connection so several uvicorn workers can share the file.
+"""
+
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+import metrics
+from customer_search import create_search_index
+from models import Base
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///./db.sqlite')
+ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL', DATABASE_URL.replace('sqlite://', 'sqlite+aiosqlite://', 1))
+DB_MODE = os.environ.get('DB_MODE', 'sync')
+if DB_MODE not in ('sync', 'async'):
+    raise ValueError(f"DB_MODE must be 'sync' or 'async', not {DB_MODE!r}")
+DB_PROFILE = os.environ.get('DB_PROFILE', 'development')
+if DB_PROFILE not in ('development', 'production'):
+    raise ValueError(f"DB_PROFILE must be 'development' or 'production', not {DB_PROFILE!r}")
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    # Negative values are KiB rather than pages.
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -65536)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),
+}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply `SQLITE_PRAGMAS` to a freshly opened connection."""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+def _engine_options(poolclass):
+    if DB_PROFILE == 'development':
+        return {'echo': True}
+    return {
+        'echo': False,
+        # Pooled connections keep their pragmas and page cache between requests.
+        'poolclass': poolclass,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    }
+
+def _configure(sync_engine):
+    if DB_PROFILE == 'production' and sync_engine.dialect.name == 'sqlite':
+        event.listen(sync_engine, 'connect', _set_sqlite_pragmas)
+
+# FastAPI may open and close a request's session on different threadpool threads.
+connect_args = {'check_same_thread': False} if DATABASE_URL.startswith('sqlite') else {}
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **_engine_options(QueuePool))
+_configure(engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+create_search_index(engine)
+if metrics.METRICS_ENABLED:
+    metrics.instrument_engine(engine)
+    metrics.instrument_sessions()
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_MODE == 'async':
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(AsyncAdaptedQueuePool))
+    _configure(async_engine.sync_engine)
+    if metrics.METRICS_ENABLED:
+        metrics.instrument_engine(async_engine.sync_engine)
+    # Objects are serialized after commit, where an expired attribute would need IO.
+    AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def get_db():
+    """Dependency that provides a database session."""
+    db = SessionLocal()
+    metrics.record_session_ready()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    """Dependency that provides an async database session."""
+    async with AsyncSessionLocal() as db:
+        metrics.record_session_ready()
+        yield db
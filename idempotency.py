@@ -0,0 +1,257 @@
+"""Idempotent order submission through the `Idempotency-Key` header.
+
+The first `POST /orders/` with a key stores its response in the
+`idempotency_keys` table, in the same transaction as the order, and every later
+request with that key gets the stored response back without writing anything.
+The unique index on the key settles races between worker processes. Within a
+process, a duplicate that arrives while the first request is still running
+waits for it instead of racing it. Recent responses are kept in a bounded LRU
+so retries of hot keys skip the database, and expired keys are purged by a
+background task.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Awaitable, Callable, Optional
+
+import anyio
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import IdempotencyKey
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 1024))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.environ.get('IDEMPOTENCY_PURGE_INTERVAL', 600))
+# How long a duplicate waits for the request that holds its key before giving up with 409.
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 30))
+MAX_KEY_LENGTH = 255
+
+logger = logging.getLogger('dosa.idempotency')
+
+StoredResponse = namedtuple('StoredResponse', 'fingerprint status_code body expires_at')
+
+
+class IdempotencyStore:
+    """Bounded LRU of stored responses plus the keys currently being processed in this process."""
+
+    def __init__(self, maxsize: int = 1024, clock: Callable[[], float] = time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._responses = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        """Return the cached response for `key`, or None on a miss or expired entry."""
+        with self._lock:
+            stored = self._responses.get(key)
+            if stored is not None and stored.expires_at > self.clock():
+                self._responses.move_to_end(key)
+                self.hits += 1
+                return stored
+            if stored is not None:
+                del self._responses[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, stored: StoredResponse) -> None:
+        """Cache a response read from the database, evicting the least recently used entry if full."""
+        with self._lock:
+            self._store(key, stored)
+
+    def claim(self, key: str) -> Optional[threading.Event]:
+        """Mark `key` as in flight and return None, or return the event of the request already holding it."""
+        with self._lock:
+            waiter = self._in_flight.get(key)
+            if waiter is None:
+                self._in_flight[key] = threading.Event()
+            return waiter
+
+    def release(self, key: str, stored: Optional[StoredResponse] = None) -> None:
+        """Finish processing `key`, caching its response if one was stored, and wake the waiting duplicates."""
+        with self._lock:
+            if stored is not None:
+                self._store(key, stored)
+            waiter = self._in_flight.pop(key, None)
+        if waiter is not None:
+            waiter.set()
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        with self._lock:
+            self._responses.clear()
+
+    def stats(self) -> dict:
+        """Return size and hit/miss counters."""
+        with self._lock:
+            return {
+                "size": len(self._responses), "maxsize": self.maxsize, "in_flight": len(self._in_flight),
+                "hits": self.hits, "misses": self.misses,
+            }
+
+    def _store(self, key: str, stored: StoredResponse) -> None:
+        self._responses[key] = stored
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.maxsize:
+            self._responses.popitem(last=False)
+
+
+store = IdempotencyStore(maxsize=IDEMPOTENCY_CACHE_SIZE)
+
+
+def fingerprint(payload: BaseModel) -> str:
+    """Hash of a request body, used to reject a key reused for a different request."""
+    return hashlib.sha256(payload.json(sort_keys=True).encode()).hexdigest()
+
+
+def _stored_query(key: str):
+    return select(
+        IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.body, IdempotencyKey.expires_at,
+    ).where(IdempotencyKey.key == key, IdempotencyKey.expires_at > int(store.clock()))
+
+
+def _cache_row(key: str, row) -> Optional[StoredResponse]:
+    if row is None:
+        return None
+    stored = StoredResponse(*row)
+    store.put(key, stored)
+    return stored
+
+
+def _expired_query(key: Optional[str] = None):
+    query = delete(IdempotencyKey).where(IdempotencyKey.expires_at <= int(store.clock()))
+    return query if key is None else query.where(IdempotencyKey.key == key)
+
+
+def _record(db, key: str, request_fingerprint: str, response: Response) -> StoredResponse:
+    """Add `response` to the session so it is committed together with the order.
+
+    The caller first deletes an expired row for the key in the same transaction,
+    since it still holds the unique index until the purge removes it.
+    """
+    stored = StoredResponse(request_fingerprint, response.status_code, response.body,
+                            int(store.clock()) + IDEMPOTENCY_TTL)
+    db.add(IdempotencyKey(key=key, **stored._asdict()))
+    return stored
+
+
+def _replay(stored: StoredResponse, request_fingerprint: str) -> Response:
+    if stored.fingerprint != request_fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    return Response(
+        content=stored.body, status_code=stored.status_code, media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _busy() -> HTTPException:
+    return HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+
+
+def run_once(db: Session, key: str, request_fingerprint: str, create: Callable[[], Response]) -> Response:
+    """Replay the response stored for `key`, or call `create` and commit its writes together with the key.
+
+    `create` adds its changes to `db` without committing and returns the response.
+    """
+    while True:
+        stored = store.get(key) or _cache_row(key, db.execute(_stored_query(key)).first())
+        if stored is not None:
+            return _replay(stored, request_fingerprint)
+        waiter = store.claim(key)
+        if waiter is None:
+            break
+        if not waiter.wait(IDEMPOTENCY_WAIT_SECONDS):
+            raise _busy()
+
+    # Stays None unless a response was committed, so waiting duplicates retry themselves.
+    stored = None
+    try:
+        response = create()
+        db.execute(_expired_query(key))
+        pending = _record(db, key, request_fingerprint, response)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker process committed the same key first.
+            db.rollback()
+            stored = _cache_row(key, db.execute(_stored_query(key)).first())
+            if stored is None:
+                raise
+            return _replay(stored, request_fingerprint)
+        stored = pending
+        return response
+    finally:
+        store.release(key, stored)
+
+
+async def run_once_async(db: AsyncSession, key: str, request_fingerprint: str,
+                         create: Callable[[], Awaitable[Response]]) -> Response:
+    """Async version of `run_once` for the async routes."""
+    while True:
+        stored = store.get(key) or _cache_row(key, (await db.execute(_stored_query(key))).first())
+        if stored is not None:
+            return _replay(stored, request_fingerprint)
+        waiter = store.claim(key)
+        if waiter is None:
+            break
+        if not await anyio.to_thread.run_sync(waiter.wait, IDEMPOTENCY_WAIT_SECONDS):
+            raise _busy()
+
+    stored = None
+    try:
+        response = await create()
+        await db.execute(_expired_query(key))
+        pending = _record(db, key, request_fingerprint, response)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            stored = _cache_row(key, (await db.execute(_stored_query(key))).first())
+            if stored is None:
+                raise
+            return _replay(stored, request_fingerprint)
+        stored = pending
+        return response
+    finally:
+        store.release(key, stored)
+
+
+def purge_expired(db: Session) -> int:
+    """Delete expired keys and return how many were removed."""
+    result = db.execute(_expired_query())
+    db.commit()
+    return result.rowcount
+
+
+def _purge_with_new_session() -> int:
+    db = SessionLocal()
+    try:
+        return purge_expired(db)
+    finally:
+        db.close()
+
+
+async def purge_periodically(interval: float = IDEMPOTENCY_PURGE_INTERVAL) -> None:
+    """Purge expired keys every `interval` seconds; started as a background task at startup."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await anyio.to_thread.run_sync(_purge_with_new_session)
+        except Exception:
+            logger.exception('purging expired idempotency keys failed')
+        else:
+            if removed:
+                logger.info('purged %d expired idempotency keys', removed)
@@ -1,10 +1,14 @@
 import sqlite3
+import sys
 
-def init_db():
+def init_db(path='db.sqlite'):
     """
     Initialize the database and create tables if they do not exist.
+
+    Safe to re-run on an existing database: missing columns and indexes are added
+    in place, and the file is switched to WAL journal mode.
     """
-    conn = sqlite3.connect('db.sqlite')
+    conn = sqlite3.connect(path)
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -37,14 +41,80 @@ def init_db():
         CREATE TABLE IF NOT EXISTS order_items (
             order_id INTEGER NOT NULL,
             item_id INTEGER NOT NULL,
+            quantity INTEGER DEFAULT 1,
+            price REAL,
             FOREIGN KEY (order_id) REFERENCES orders(id),
             FOREIGN KEY (item_id) REFERENCES items(id),
             PRIMARY KEY (order_id, item_id)
         );
     ''')
 
+    # Sales rollups maintained by analytics.py; backfill with `python analytics.py rebuild`.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_sales_rollup (
+            item_id INTEGER PRIMARY KEY,
+            quantity INTEGER NOT NULL,
+            revenue REAL NOT NULL
+        );
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS hourly_sales_rollup (
+            hour INTEGER PRIMARY KEY,
+            orders INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            revenue REAL NOT NULL
+        );
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customer_spend_rollup (
+            customer_id INTEGER PRIMARY KEY,
+            orders INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            revenue REAL NOT NULL
+        );
+    ''')
+
+    # Responses replayed for retried order submissions, see idempotency.py.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status_code INTEGER NOT NULL,
+            body BLOB NOT NULL,
+            expires_at INTEGER NOT NULL
+        );
+    ''')
+
+    # Name search index kept in sync by customer_search.py; filled from existing customers when first created.
+    tables = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    if 'customer_search' not in tables:
+        cursor.execute("CREATE VIRTUAL TABLE customer_search USING fts5(name, prefix='1 2 3')")
+        cursor.execute('INSERT INTO customer_search (rowid, name) SELECT id, name FROM customers')
+
+    # Databases created before `quantity` was tracked are missing the column.
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(order_items)')]
+    if 'quantity' not in columns:
+        cursor.execute('ALTER TABLE order_items ADD COLUMN quantity INTEGER DEFAULT 1')
+    # Lines sold before unit prices were recorded are priced at the current menu price.
+    if 'price' not in columns:
+        cursor.execute('ALTER TABLE order_items ADD COLUMN price REAL')
+        cursor.execute('UPDATE order_items SET price = (SELECT price FROM items WHERE items.id = order_items.item_id)')
+
+    # Index names match the ones SQLAlchemy generates for `index=True` in models.py.
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_orders_customer_id ON orders (customer_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_orders_timestamp ON orders (timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_order_items_item_id ON order_items (item_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_customer_spend_rollup_revenue ON customer_spend_rollup (revenue)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_idempotency_keys_key ON idempotency_keys (key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at ON idempotency_keys (expires_at)')
+
     conn.commit()
+    # WAL is persistent, so existing files only need switching once.
+    cursor.execute('PRAGMA journal_mode=WAL')
     conn.close()
 
 if __name__ == "__main__":
-    init_db()  # Initialize the database by creating necessary tables.
+    init_db(*sys.argv[1:2])  # Initialize or migrate the database, optionally at the given path.
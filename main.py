@@ -2,35 +2,111 @@
 Provides endpoints for CRUD operations on customers, items, and orders.
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+from typing import List, Optional
+
+import orjson
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
-from models import Base, Customer, Item, Order
-from schemas import CustomerCreate, CustomerResponse, ItemCreate, ItemResponse, OrderCreate, OrderResponse
+import analytics
+import customer_search
+import idempotency
+import metrics
+import order_events
+import order_validation
+import serializers
+from database import DB_MODE, SessionLocal, async_engine, engine, get_db
+from menu_cache import etag_matches, menu_cache
+from models import Customer, Item, Order, OrderItem
+from order_export import MEDIA_TYPES, iter_export
+from order_validation import IN_CLAUSE_CHUNK
+from schemas import (
+    BulkOrderResult, CustomerCreate, CustomerResponse, ExportFormat, ItemCreate, ItemResponse, OrderCreate,
+    OrderPage, OrderResponse,
+)
+from serializers import ORJSONResponse
 
 app = FastAPI()
+app.router.route_class = metrics.route_class
+# CRUD routes; replaced by their async versions when DB_MODE is "async".
+router = APIRouter(route_class=metrics.route_class)
+
+def _existing_ids(db: Session, column, ids):
+    """Return the subset of `ids` present in `column`, using chunked set-based lookups."""
+    found = set()
+    for chunk in order_validation.id_chunks(ids):
+        found.update(row[0] for row in db.query(column).filter(column.in_(chunk)))
+    return found
+
+def _item_prices(db: Session, ids) -> dict:
+    """Return the current price of each of `ids` that exists, using chunked set-based lookups."""
+    prices = {}
+    for chunk in order_validation.id_chunks(ids):
+        prices.update(db.query(Item.id, Item.price).filter(Item.id.in_(chunk)))
+    return prices
+
+def _order_dicts(db: Session, query) -> List[dict]:
+    """Run an `orders_query` and load its line items in one extra SELECT, as plain dicts."""
+    order_rows = db.execute(query).all()
+    if not order_rows:
+        return []
+    line_rows = db.execute(serializers.lines_query(row.id for row in order_rows)).all()
+    return serializers.order_dicts(order_rows, line_rows)
 
-# Setup database connection
-engine = create_engine('sqlite:///./db.sqlite', echo=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
+def _load_menu(db: Session) -> List[ItemResponse]:
+    return [ItemResponse.from_orm(item) for item in db.query(Item).order_by(Item.id)]
 
-def get_db():
-    """Dependency that provides a database session."""
+@app.on_event("startup")
+def warm_menu_cache():
+    """Fill the menu cache and snapshot once at startup."""
     db = SessionLocal()
     try:
-        yield db
+        items = _load_menu(db)
+        menu_cache.load(items)
+        menu_cache.snapshot(lambda: items)
     finally:
         db.close()
 
+@app.on_event("startup")
+async def start_idempotency_purge():
+    """Purge expired idempotency keys in the background."""
+    app.state.idempotency_purge = asyncio.create_task(idempotency.purge_periodically())
+
+@app.on_event("shutdown")
+async def stop_idempotency_purge():
+    purge = getattr(app.state, "idempotency_purge", None)
+    if purge is not None:
+        purge.cancel()
+
+@app.on_event("shutdown")
+async def dispose_engines():
+    """Close pooled connections; aiosqlite connections otherwise keep worker threads alive."""
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.registry.extra_collectors.append(lambda: [
+        '# HELP dosa_menu_cache_requests_total Menu cache lookups by result.',
+        '# TYPE dosa_menu_cache_requests_total counter',
+        f'dosa_menu_cache_requests_total{{result="hit"}} {menu_cache.hits}',
+        f'dosa_menu_cache_requests_total{{result="miss"}} {menu_cache.misses}',
+    ])
+
+    @app.get("/metrics", include_in_schema=False)
+    async def read_metrics():
+        """Expose request, SQL and cache metrics in Prometheus text format."""
+        return Response(content=metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"Hello": "World from Dosa API"}
 
 # Customer endpoints
-@app.post("/customers/", response_model=CustomerResponse)
+@router.post("/customers/", response_model=CustomerResponse)
 def create_customer(customer: CustomerCreate, db: Session = Depends(get_db)):
     """Create a new customer entry in the database."""
     db_customer = Customer(name=customer.name, phone=customer.phone)
@@ -39,15 +115,34 @@ def create_customer(customer: CustomerCreate, db: Session = Depends(get_db)):
     db.refresh(db_customer)
     return db_customer
 
-@app.get("/customers/{customer_id}", response_model=CustomerResponse)
+@router.get("/customers/by-phone/{phone}", response_model=CustomerResponse)
+def read_customer_by_phone(phone: str, db: Session = Depends(get_db)):
+    """Retrieve a customer by exact phone number."""
+    row = db.execute(customer_search.by_phone_query(phone)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return ORJSONResponse(serializers.customer_dict(row))
+
+@router.get("/customers/search", response_model=List[CustomerResponse])
+def search_customers(
+    q: str,
+    limit: int = Query(customer_search.CUSTOMER_SEARCH_LIMIT, ge=1, le=customer_search.CUSTOMER_SEARCH_MAX_LIMIT),
+    db: Session = Depends(get_db),
+):
+    """Typeahead search on phone prefix, or on prefixes of the words in a customer's name."""
+    query = customer_search.search_query(q, limit)
+    rows = db.execute(query).all() if query is not None else []
+    return ORJSONResponse([serializers.customer_dict(row) for row in rows])
+
+@router.get("/customers/{customer_id}", response_model=CustomerResponse)
 def read_customer(customer_id: int, db: Session = Depends(get_db)):
     """Retrieve a customer by ID."""
-    db_customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if db_customer is None:
+    row = db.execute(serializers.customer_query(customer_id)).first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    return db_customer
+    return ORJSONResponse(serializers.customer_dict(row))
 
-@app.delete("/customers/{customer_id}", status_code=204)
+@router.delete("/customers/{customer_id}", status_code=204, response_class=Response)
 def delete_customer(customer_id: int, db: Session = Depends(get_db)):
     """Delete a customer by ID."""
     db_customer = db.query(Customer).filter(Customer.id == customer_id).first()
@@ -56,7 +151,7 @@ def delete_customer(customer_id: int, db: Session = Depends(get_db)):
     db.delete(db_customer)
     db.commit()
 
-@app.put("/customers/{customer_id}", response_model=CustomerResponse)
+@router.put("/customers/{customer_id}", response_model=CustomerResponse)
 def update_customer(customer_id: int, customer: CustomerCreate, db: Session = Depends(get_db)):
     """Update a customer's information."""
     db_customer = db.query(Customer).filter(Customer.id == customer_id).first()
@@ -68,24 +163,39 @@ def update_customer(customer_id: int, customer: CustomerCreate, db: Session = De
     return db_customer
 
 # Item endpoints
-@app.post("/items/", response_model=ItemResponse)
+@router.post("/items/", response_model=ItemResponse)
 def create_item(item: ItemCreate, db: Session = Depends(get_db)):
     """Create a new item entry in the database."""
     db_item = Item(name=item.name, price=item.price)
     db.add(db_item)
     db.commit()
     db.refresh(db_item)
+    menu_cache.write(ItemResponse.from_orm(db_item))
     return db_item
 
-@app.get("/items/{item_id}", response_model=ItemResponse)
+@router.get("/items/", response_model=List[ItemResponse])
+def read_items(if_none_match: str = Header(None), db: Session = Depends(get_db)):
+    """Retrieve the full menu from the cached JSON snapshot, honouring If-None-Match."""
+    body, etag = menu_cache.snapshot(lambda: _load_menu(db))
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+@router.get("/items/{item_id}", response_model=ItemResponse)
 def read_item(item_id: int, db: Session = Depends(get_db)):
-    """Retrieve an item by ID."""
+    """Retrieve an item by ID, served from the menu cache when possible."""
+    cached = menu_cache.get(item_id)
+    if cached is not None:
+        return ORJSONResponse(serializers.item_dict(cached))
+    generation = menu_cache.generation
     db_item = db.query(Item).filter(Item.id == item_id).first()
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    return db_item
+    item = ItemResponse.from_orm(db_item)
+    menu_cache.put(item, generation)
+    return ORJSONResponse(serializers.item_dict(item))
 
-@app.delete("/items/{item_id}", status_code=204)
+@router.delete("/items/{item_id}", status_code=204, response_class=Response)
 def delete_item(item_id: int, db: Session = Depends(get_db)):
     """Delete an item by ID."""
     db_item = db.query(Item).filter(Item.id == item_id).first()
@@ -93,8 +203,9 @@ def delete_item(item_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Item not found")
     db.delete(db_item)
     db.commit()
+    menu_cache.invalidate(item_id)
 
-@app.put("/items/{item_id}", response_model=ItemResponse)
+@router.put("/items/{item_id}", response_model=ItemResponse)
 def update_item(item_id: int, item: ItemCreate, db: Session = Depends(get_db)):
     """Update an item's details."""
     db_item = db.query(Item).filter(Item.id == item_id).first()
@@ -103,36 +214,165 @@ def update_item(item_id: int, item: ItemCreate, db: Session = Depends(get_db)):
     db_item.name = item.name
     db_item.price = item.price
     db.commit()
+    menu_cache.write(ItemResponse.from_orm(db_item))
     return db_item
 
 # Order endpoints
-@app.post("/orders/", response_model=OrderResponse)
-def create_order(order: OrderCreate, db: Session = Depends(get_db)):
-    """Create a new order in the database."""
+def _add_order(db: Session, order: OrderCreate) -> ORJSONResponse:
+    """Add and flush a new order, returning its response without committing."""
+    customer_ids = _existing_ids(db, Customer.id, {order.customer_id})
+    prices = _item_prices(db, {oi.item_id for oi in order.items})
+    order_validation.check_order(order, customer_ids, prices.keys())
     db_order = Order(customer_id=order.customer_id, timestamp=order.timestamp, notes=order.notes)
+    for order_item in order.items:
+        db_order.items.append(OrderItem(
+            item_id=order_item.item_id, quantity=order_item.quantity, price=prices[order_item.item_id],
+        ))
     db.add(db_order)
+    db.flush()
+    response = ORJSONResponse(_order_dicts(db, serializers.orders_query().where(Order.id == db_order.id))[0])
+    order_events.publish_after_commit(db, "created", response.body)
+    return response
+
+@router.post("/orders/", response_model=OrderResponse)
+def create_order(
+    order: OrderCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=idempotency.MAX_KEY_LENGTH),
+    db: Session = Depends(get_db),
+):
+    """Create a new order in the database.
+
+    Retries that send the same `Idempotency-Key` get the first response back without creating another order.
+    """
+    if idempotency_key is not None:
+        fingerprint = idempotency.fingerprint(order)
+        return idempotency.run_once(db, idempotency_key, fingerprint, lambda: _add_order(db, order))
+    response = _add_order(db, order)
     db.commit()
-    db.refresh(db_order)
-    return db_order
+    return response
+
+@app.post("/orders/bulk", response_model=List[BulkOrderResult])
+def create_orders_bulk(orders: List[OrderCreate], db: Session = Depends(get_db)):
+    """Create many orders in a single transaction.
+
+    Customers and items are validated with set-based lookups; orders that reference
+    unknown ids are rejected individually while the rest are written with executemany
+    inserts. Results are returned in the same order as the payload.
+    """
+    customer_ids = _existing_ids(db, Customer.id, {order.customer_id for order in orders})
+    prices = _item_prices(db, {oi.item_id for order in orders for oi in order.items})
+
+    results = []
+    accepted = []
+    for index, order in enumerate(orders):
+        error = order_validation.order_error(order, customer_ids, prices.keys())
+        results.append({"index": index, "id": None, "status": "rejected" if error else "created", "error": error})
+        if error is None:
+            accepted.append(index)
+
+    if accepted:
+        order_table = Order.__table__
+        rows = [
+            {"customer_id": orders[i].customer_id, "timestamp": orders[i].timestamp, "notes": orders[i].notes}
+            for i in accepted
+        ]
+        # The first insert takes SQLite's write lock, so no other writer can claim rowids
+        # before the transaction ends and the remaining ids can be assigned contiguously.
+        first_id = db.execute(order_table.insert().values(**rows[0])).inserted_primary_key[0]
+        for offset, row in enumerate(rows[1:], start=1):
+            row["id"] = first_id + offset
+        if len(rows) > 1:
+            db.execute(order_table.insert(), rows[1:])
+
+        line_rows = []
+        for offset, i in enumerate(accepted):
+            results[i]["id"] = first_id + offset
+            line_rows.extend(
+                {"order_id": first_id + offset, "item_id": oi.item_id, "quantity": oi.quantity,
+                 "price": prices[oi.item_id]}
+                for oi in orders[i].items
+            )
+        if line_rows:
+            db.execute(OrderItem.__table__.insert(), line_rows)
+        end_id = first_id + len(rows)
+        for start in range(first_id, end_id, IN_CLAUSE_CHUNK):
+            query = serializers.orders_query().where(Order.id >= start, Order.id < min(start + IN_CLAUSE_CHUNK, end_id))
+            for created in _order_dicts(db, query.order_by(Order.id)):
+                order_events.publish_after_commit(db, "created", orjson.dumps(created))
+        # Core inserts bypass the ORM flush that keeps the sales rollups current.
+        analytics.apply_order_deltas(
+            db,
+            orders=[(1, row["customer_id"], row["timestamp"]) for row in rows],
+            lines=[
+                (1, orders[i].customer_id, orders[i].timestamp, oi.item_id, oi.quantity, prices[oi.item_id])
+                for i in accepted for oi in orders[i].items
+            ],
+        )
+        db.commit()
+    return results
 
-@app.get("/orders/{order_id}", response_model=OrderResponse)
+@app.get("/orders/export")
+def export_orders(
+    from_ts: int = Query(..., alias="from"),
+    to_ts: int = Query(..., alias="to"),
+    format: ExportFormat = ExportFormat.ndjson,
+):
+    """Stream orders with `from <= timestamp < to` as NDJSON or CSV, one row per order line."""
+    return StreamingResponse(
+        iter_export(from_ts, to_ts, format.value),
+        media_type=MEDIA_TYPES[format.value],
+        headers={"Content-Disposition": f'attachment; filename="orders-{from_ts}-{to_ts}.{format.value}"'},
+    )
+
+@app.get("/orders/stream")
+async def stream_orders(last_event_id: Optional[int] = Header(None)):
+    """Server-sent events for created, updated and deleted orders.
+
+    Reconnect with `Last-Event-ID` to receive the events missed in between; a `reset` event means
+    they are no longer available and the client should reload the orders.
+    """
+    return StreamingResponse(
+        order_events.bus.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/orders/", response_model=OrderPage)
+def list_orders(
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    """List orders by ascending ID using keyset pagination.
+
+    Pass the returned `next_after_id` as `after_id` to fetch the following page.
+    """
+    query = serializers.orders_query()
+    if after_id is not None:
+        query = query.where(Order.id > after_id)
+    orders = _order_dicts(db, query.order_by(Order.id).limit(limit))
+    next_after_id = orders[-1]["id"] if len(orders) == limit else None
+    return ORJSONResponse({"orders": orders, "next_after_id": next_after_id})
+
+@router.get("/orders/{order_id}", response_model=OrderResponse)
 def read_order(order_id: int, db: Session = Depends(get_db)):
     """Retrieve an order by ID."""
-    db_order = db.query(Order).filter(Order.id == order_id).first()
-    if db_order is None:
+    orders = _order_dicts(db, serializers.orders_query().where(Order.id == order_id))
+    if not orders:
         raise HTTPException(status_code=404, detail="Order not found")
-    return db_order
+    return ORJSONResponse(orders[0])
 
-@app.delete("/orders/{order_id}", status_code=204)
+@router.delete("/orders/{order_id}", status_code=204, response_class=Response)
 def delete_order(order_id: int, db: Session = Depends(get_db)):
     """Delete an order by ID."""
     db_order = db.query(Order).filter(Order.id == order_id).first()
     if db_order is None:
         raise HTTPException(status_code=404, detail="Order not found")
     db.delete(db_order)
+    order_events.publish_after_commit(db, "deleted", orjson.dumps({"id": order_id}))
     db.commit()
 
-@app.put("/orders/{order_id}", response_model=OrderResponse)
+@router.put("/orders/{order_id}", response_model=OrderResponse)
 def update_order(order_id: int, order: OrderCreate, db: Session = Depends(get_db)):
     """Update an order's details."""
     db_order = db.query(Order).filter(Order.id == order_id).first()
@@ -141,5 +381,15 @@ def update_order(order_id: int, order: OrderCreate, db: Session = Depends(get_db
     db_order.customer_id = order.customer_id
     db_order.timestamp = order.timestamp
     db_order.notes = order.notes
+    db.flush()
+    response = ORJSONResponse(_order_dicts(db, serializers.orders_query().where(Order.id == order_id))[0])
+    order_events.publish_after_commit(db, "updated", response.body)
     db.commit()
-    return db_order
+    return response
+
+if DB_MODE == "async":
+    from async_routes import router as crud_router
+else:
+    crud_router = router
+app.include_router(crud_router)
+app.include_router(analytics.router)
@@ -0,0 +1,143 @@
+"""In-process read cache for menu items.
+
+Menu items change rarely and are read on almost every request, so validated
+`ItemResponse` objects are kept in memory and the full menu is kept as a
+pre-serialized JSON snapshot with an ETag. Writes go through the cache so a
+single process never serves stale data; the TTL bounds staleness across
+multiple worker processes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from schemas import ItemResponse
+
+
+class MenuCache:
+    """Bounded LRU of `ItemResponse` objects plus a full-menu JSON snapshot."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._snapshot = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, item_id: int) -> Optional[ItemResponse]:
+        """Return the cached item, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._items.get(item_id)
+            if entry is not None and entry[0] > self.clock():
+                self._items.move_to_end(item_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._items[item_id]
+            self.misses += 1
+            return None
+
+    @property
+    def generation(self) -> int:
+        """Counter bumped by every write; pass it back to `put` to detect races."""
+        return self._generation
+
+    def put(self, item: ItemResponse, generation: Optional[int] = None) -> None:
+        """Store an item read from the database, evicting the least recently used entry if full.
+
+        If `generation` is given and a write happened since it was read, the
+        item may be stale and is not stored.
+        """
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._store(item)
+
+    def load(self, items: Iterable[ItemResponse]) -> None:
+        """Replace the cache contents, e.g. when warming at startup."""
+        with self._lock:
+            self._items.clear()
+            for item in items:
+                self._store(item)
+            self._invalidate_snapshot()
+
+    def write(self, item: ItemResponse) -> None:
+        """Write-through after an item was created or updated."""
+        with self._lock:
+            self._store(item)
+            self._invalidate_snapshot()
+
+    def invalidate(self, item_id: int) -> None:
+        """Drop an item after it was deleted."""
+        with self._lock:
+            self._items.pop(item_id, None)
+            self._invalidate_snapshot()
+
+    def clear(self) -> None:
+        """Drop every cached item and the menu snapshot."""
+        with self._lock:
+            self._items.clear()
+            self._invalidate_snapshot()
+
+    def snapshot(self, loader: Callable[[], List[ItemResponse]]) -> Tuple[bytes, str]:
+        """Return the full menu as `(json_bytes, etag)`, rebuilding with `loader` if stale."""
+        cached = self.cached_snapshot()
+        if cached is not None:
+            return cached
+        generation = self.generation
+        return self.store_snapshot(loader(), generation)
+
+    def cached_snapshot(self) -> Optional[Tuple[bytes, str]]:
+        """Return the current `(json_bytes, etag)` if it is still fresh, else None."""
+        with self._lock:
+            if self._snapshot is not None and self._snapshot[0] > self.clock():
+                self.hits += 1
+                return self._snapshot[1], self._snapshot[2]
+            self.misses += 1
+            return None
+
+    def store_snapshot(self, items: List[ItemResponse], generation: int) -> Tuple[bytes, str]:
+        """Serialize `items` as the menu snapshot, read while `generation` was current."""
+        body = json.dumps([item.dict() for item in items], separators=(",", ":")).encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        with self._lock:
+            # A write that landed while the items were loaded makes this snapshot stale already.
+            if generation == self._generation:
+                self._snapshot = (self.clock() + self.ttl, body, etag)
+        return body, etag
+
+    def stats(self) -> dict:
+        """Return size and hit/miss counters."""
+        with self._lock:
+            return {"size": len(self._items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def _store(self, item: ItemResponse) -> None:
+        self._items[item.id] = (self.clock() + self.ttl, item)
+        self._items.move_to_end(item.id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def _invalidate_snapshot(self) -> None:
+        self._snapshot = None
+        self._generation += 1
+
+
+menu_cache = MenuCache(
+    maxsize=int(os.environ.get('MENU_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('MENU_CACHE_TTL', 300)),
+)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against `etag` using weak comparison."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
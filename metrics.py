@@ -0,0 +1,320 @@
+"""Per-route performance instrumentation exposed in Prometheus text format.
+
+For every request the middleware records latency, the number and duration of
+SQL statements, the time until `get_db` handed out a session (dominated by
+waiting for a threadpool worker when the threadpool is saturated), the time
+spent waiting for the connection pool to hand out a connection, and the time
+spent serializing the result. Serialization covers validating and encoding a
+returned object between the endpoint returning and the response starting, plus
+any builder or encoder wrapped with `timed_serialization` that runs inside the
+endpoint, which is where the fast response path does its work.
+
+Set `METRICS_ENABLED=0` to install none of the hooks; the only cost left is
+one context variable lookup per session. `SLOW_REQUEST_MS` enables a log of
+requests slower than the threshold together with the statements they ran.
+"""
+
+import functools
+import inspect
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') not in ('0', 'false', 'no')
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+SLOW_LOG_MAX_STATEMENTS = 50
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger('dosa.slow_requests')
+
+_current: ContextVar[Optional['RequestStats']] = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Measurements collected while one request is being handled."""
+    __slots__ = (
+        'start', 'route', 'statements', 'sql_seconds', 'db_wait', 'checkouts', 'checkout_seconds', 'endpoint_done',
+        'serialize_seconds', 'statement_log',
+    )
+
+    def __init__(self, start: float, log_statements: bool):
+        self.start = start
+        self.route = None
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.db_wait = None
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.endpoint_done = None
+        # Serialization done inside the endpoint, see `timed_serialization`.
+        self.serialize_seconds = 0.0
+        self.statement_log = [] if log_statements else None
+
+
+class RouteMetrics:
+    """Aggregated measurements for one method and route."""
+    __slots__ = (
+        'buckets', 'count', 'latency_sum', 'statements', 'sql_seconds',
+        'db_waits', 'db_wait_seconds', 'checkouts', 'checkout_seconds', 'serializations', 'serialize_seconds',
+    )
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.latency_sum = 0.0
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.db_waits = 0
+        self.db_wait_seconds = 0.0
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.serializations = 0
+        self.serialize_seconds = 0.0
+
+    def observe(self, latency: float, stats: RequestStats, serialize: Optional[float]) -> None:
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[index] += 1
+                break
+        self.count += 1
+        self.latency_sum += latency
+        self.statements += stats.statements
+        self.sql_seconds += stats.sql_seconds
+        if stats.db_wait is not None:
+            self.db_waits += 1
+            self.db_wait_seconds += stats.db_wait
+        self.checkouts += stats.checkouts
+        self.checkout_seconds += stats.checkout_seconds
+        if serialize is not None:
+            self.serializations += 1
+            self.serialize_seconds += serialize
+
+
+class Registry:
+    """Route metrics keyed by `(method, route)`.
+
+    Only updated and rendered on the event loop thread, so it needs no lock.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.extra_collectors = []
+
+    def observe(self, method: str, route: str, latency: float, stats: RequestStats,
+                serialize: Optional[float]) -> None:
+        key = (method, route)
+        metrics = self.routes.get(key)
+        if metrics is None:
+            metrics = self.routes[key] = RouteMetrics()
+        metrics.observe(latency, stats, serialize)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+
+        routes = sorted(self.routes.items())
+        labels = {key: f'method="{_escape(key[0])}",route="{_escape(key[1])}"' for key, _ in routes}
+
+        histogram = []
+        for key, metrics in routes:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                cumulative += count
+                histogram.append(f'dosa_request_duration_seconds_bucket{{{labels[key]},le="{bound}"}} {cumulative}')
+            histogram.append(f'dosa_request_duration_seconds_bucket{{{labels[key]},le="+Inf"}} {metrics.count}')
+            histogram.append(f'dosa_request_duration_seconds_sum{{{labels[key]}}} {metrics.latency_sum}')
+            histogram.append(f'dosa_request_duration_seconds_count{{{labels[key]}}} {metrics.count}')
+        family('dosa_request_duration_seconds', 'histogram', 'Request latency by route.', histogram)
+
+        for name, attribute, help_text in (
+            ('dosa_sql_statements_total', 'statements', 'SQL statements executed by route.'),
+            ('dosa_sql_seconds_total', 'sql_seconds', 'Time spent executing SQL statements by route.'),
+            ('dosa_db_session_waits_total', 'db_waits', 'Database sessions handed out by route.'),
+            ('dosa_db_session_wait_seconds_total', 'db_wait_seconds',
+             'Time from request start until get_db handed out a session, mostly threadpool queueing.'),
+            ('dosa_db_checkouts_total', 'checkouts', 'Connections checked out of the pool by route.'),
+            ('dosa_db_checkout_wait_seconds_total', 'checkout_seconds',
+             'Time spent waiting for the pool to hand out a connection, including opening new ones.'),
+            ('dosa_serializations_total', 'serializations', 'Responses serialized by route.'),
+            ('dosa_serialize_seconds_total', 'serialize_seconds',
+             'Time spent building and encoding response bodies by route.'),
+        ):
+            family(name, 'counter', help_text,
+                   [f'{name}{{{labels[key]}}} {getattr(metrics, attribute)}' for key, metrics in routes])
+
+        for collect in self.extra_collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """ASGI middleware that times each HTTP request and records it in `registry`."""
+
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_seconds = slow_request_ms / 1000 if slow_request_ms > 0 else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(time.perf_counter(), self.slow_request_seconds is not None)
+        token = _current.set(stats)
+        response_started = None
+
+        async def timed_send(message):
+            nonlocal response_started
+            if response_started is None and message['type'] == 'http.response.start':
+                response_started = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _current.reset(token)
+            latency = time.perf_counter() - stats.start
+            serialize = None
+            if stats.endpoint_done is not None and response_started is not None:
+                serialize = max(0.0, response_started - stats.endpoint_done) + stats.serialize_seconds
+            route = stats.route or 'unmatched'
+            registry.observe(scope['method'], route, latency, stats, serialize)
+            if self.slow_request_seconds is not None and latency >= self.slow_request_seconds:
+                _log_slow_request(scope['method'], route, scope['path'], latency, stats)
+
+
+def _log_slow_request(method, route, path, latency, stats):
+    statements = '\n'.join(f'  {seconds * 1000:8.2f} ms  {sql}' for sql, seconds in stats.statement_log)
+    logger.warning(
+        'slow request %s %s (%s) took %.1f ms with %d statements (%.1f ms SQL, %.1f ms connection wait)\n%s',
+        method, path, route, latency * 1000, stats.statements, stats.sql_seconds * 1000,
+        stats.checkout_seconds * 1000, statements,
+    )
+
+
+def record_session_ready() -> None:
+    """Called by the session dependencies once a session has been handed out."""
+    stats = _current.get()
+    if stats is not None and stats.db_wait is None:
+        stats.db_wait = time.perf_counter() - stats.start
+
+
+def _transaction_created(session, transaction):
+    # A session checks out its connection right after starting a root transaction.
+    if transaction.parent is None and _current.get() is not None:
+        session.info['checkout_start'] = time.perf_counter()
+
+
+def _connection_checked_out(session, transaction, connection):
+    start = session.info.pop('checkout_start', None)
+    stats = _current.get()
+    if start is not None and stats is not None:
+        stats.checkouts += 1
+        stats.checkout_seconds += time.perf_counter() - start
+
+
+def instrument_sessions() -> None:
+    """Time how long every session (sync or async) waits to check out its connection."""
+    event.listen(Session, 'after_transaction_create', _transaction_created)
+    event.listen(Session, 'after_begin', _connection_checked_out)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats.statements += 1
+    stats.sql_seconds += elapsed
+    if stats.statement_log is not None and len(stats.statement_log) < SLOW_LOG_MAX_STATEMENTS:
+        stats.statement_log.append((' '.join(statement.split()), elapsed))
+
+
+def instrument_engine(sync_engine) -> None:
+    """Count and time the SQL statements run through `sync_engine` on behalf of a request."""
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def timed_serialization(fn):
+    """Wrap a response builder or encoder so its time counts as serialization for the current request."""
+    if not METRICS_ENABLED:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.serialize_seconds += time.perf_counter() - start
+    return wrapper
+
+
+def _timed_endpoint(endpoint, path):
+    """Wrap an endpoint so the request knows its route and when the endpoint returned."""
+    if getattr(endpoint, '_metrics_route', None) is not None:
+        return endpoint
+
+    def mark(stats):
+        if stats is not None:
+            stats.route = path
+            stats.endpoint_done = time.perf_counter()
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            stats = _current.get()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                mark(stats)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            stats = _current.get()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                mark(stats)
+    wrapper._metrics_route = path
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """APIRoute whose endpoint reports its route template and completion time."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint, path), **kwargs)
+
+
+route_class = TimedRoute if METRICS_ENABLED else APIRoute
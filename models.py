@@ -1,6 +1,6 @@
 """Module for defining database models for a Dosa restaurant management system."""
 
-from sqlalchemy import Column, ForeignKey, Integer, String, Float, create_engine
+from sqlalchemy import Column, ForeignKey, Integer, LargeBinary, String, Float, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -19,27 +19,63 @@ class Item(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     price = Column(Float, nullable=False)
-    orders = relationship("OrderItem", back_populates="item")
+    # Deleting a menu item leaves past order lines with their item_id instead of nulling part of their key.
+    orders = relationship("OrderItem", back_populates="item", passive_deletes="all")
 
 class Order(Base):
     """Data model for orders, storing details about customer orders including the customer and items ordered."""
     __tablename__ = 'orders'
     id = Column(Integer, primary_key=True)
-    customer_id = Column(Integer, ForeignKey('customers.id'), nullable=False)
-    timestamp = Column(Integer, nullable=False)
+    customer_id = Column(Integer, ForeignKey('customers.id'), nullable=False, index=True)
+    timestamp = Column(Integer, nullable=False, index=True)
     notes = Column(String, nullable=True)
     customer = relationship("Customer")
-    items = relationship("OrderItem", back_populates="order")
+    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
 class OrderItem(Base):
     """Data model for order items, representing the many-to-many relationship between orders and items with quantity tracking."""
     __tablename__ = 'order_items'
     order_id = Column(Integer, ForeignKey('orders.id'), primary_key=True)
-    item_id = Column(Integer, ForeignKey('items.id'), primary_key=True)
+    item_id = Column(Integer, ForeignKey('items.id'), primary_key=True, index=True)
     quantity = Column(Integer, default=1)
+    # Unit price when the line was sold, so later menu price changes do not rewrite past revenue.
+    price = Column(Float)
     order = relationship("Order", back_populates="items")
     item = relationship("Item", back_populates="orders")
 
+class ItemSalesRollup(Base):
+    """Rollup of quantity sold and revenue per menu item, maintained incrementally by `analytics`."""
+    __tablename__ = 'item_sales_rollup'
+    item_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+class HourlySalesRollup(Base):
+    """Rollup of orders, quantity and revenue per hour, keyed by the hour's starting timestamp."""
+    __tablename__ = 'hourly_sales_rollup'
+    hour = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+class CustomerSpendRollup(Base):
+    """Rollup of orders, quantity and spend per customer."""
+    __tablename__ = 'customer_spend_rollup'
+    customer_id = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0, index=True)
+
+class IdempotencyKey(Base):
+    """Response stored for an `Idempotency-Key` sent with an order, replayed to retries until `expires_at`."""
+    __tablename__ = 'idempotency_keys'
+    id = Column(Integer, primary_key=True)
+    key = Column(String, nullable=False, unique=True, index=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+    expires_at = Column(Integer, nullable=False, index=True)
+
 def init_db():
     """Initializes the database by creating all tables based on the defined models."""
     engine = create_engine('sqlite:///./db.sqlite', echo=True)
@@ -0,0 +1,165 @@
+"""In-process bus that pushes order changes to kitchen displays over server-sent events.
+
+Order endpoints queue an event on their session with `publish_after_commit`.
+It is published only once the transaction commits and dropped on rollback.
+Each event is framed as SSE once and the same bytes are fanned out to every
+subscriber of `GET /orders/stream`. The events of one commit, such as a bulk
+order, are delivered together as one batch.
+
+Each subscriber has a bounded queue of batches, so a large commit takes a
+single slot. Publishing never waits for a slow client. A subscriber whose queue
+is full stops receiving; its stream ends after draining what is queued, and the
+client reconnects with `Last-Event-ID`.
+Recent events are kept in a ring buffer so a reconnecting client gets what it
+missed. If the missed events have left the buffer, or the server restarted,
+the client gets a `reset` event and should reload the order list.
+
+Event ids and subscribers are per process, so with several workers a display
+only sees orders written through the worker it is connected to.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+ORDER_EVENTS_HISTORY = int(os.environ.get('ORDER_EVENTS_HISTORY', 1000))
+ORDER_EVENTS_QUEUE_SIZE = int(os.environ.get('ORDER_EVENTS_QUEUE_SIZE', 100))
+ORDER_EVENTS_KEEPALIVE = float(os.environ.get('ORDER_EVENTS_KEEPALIVE', 15))
+
+RESET_MESSAGE = b'event: reset\ndata: {}\n\n'
+KEEPALIVE_MESSAGE = b': keepalive\n\n'
+
+# `message` is the complete SSE frame; `published_at` is a `time.perf_counter()` reading.
+OrderEvent = namedtuple('OrderEvent', 'id type message published_at')
+
+
+class Subscriber:
+    """Bounded queue of event batches for one stream; `lagged` is set once it overflowed."""
+    __slots__ = ('queue', 'lagged')
+
+    def __init__(self, maxsize: int):
+        self.queue = asyncio.Queue(maxsize)
+        self.lagged = False
+
+
+class OrderEventBus:
+    """Fan-out of order events to subscribers on one event loop, with a replay buffer."""
+
+    def __init__(self, history: int = 1000, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history)
+        self._next_id = 1
+        self._subscribers = set()
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data: bytes) -> OrderEvent:
+        """Record an event and deliver it to every subscriber; safe to call from any thread."""
+        return self.publish_batch([(event_type, data)])[0]
+
+    def publish_batch(self, events: Iterable[Tuple[str, bytes]]) -> List[OrderEvent]:
+        """Record `(event_type, data)` pairs under consecutive ids and deliver them as one batch."""
+        with self._lock:
+            now = time.perf_counter()
+            batch = []
+            for event_type, data in events:
+                event_id = self._next_id
+                self._next_id += 1
+                message = b'id: %d\nevent: order.%s\ndata: %s\n\n' % (event_id, event_type.encode(), data)
+                batch.append(OrderEvent(event_id, event_type, message, now))
+            self._history.extend(batch)
+            # Scheduling under the lock keeps delivery in id order across publishing threads.
+            if batch and self._loop is not None and self._subscribers:
+                try:
+                    self._loop.call_soon_threadsafe(self._deliver, tuple(batch))
+                except RuntimeError:
+                    # The loop the subscribers ran on has been closed.
+                    self._loop = None
+        return batch
+
+    def _deliver(self, batch: Tuple[OrderEvent, ...]) -> None:
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                subscriber.lagged = True
+                self._subscribers.discard(subscriber)
+
+    def subscribe(self, last_event_id: Optional[int] = None):
+        """Register a subscriber on the running loop.
+
+        Returns `(subscriber, replay, reset, last_id)`: the events after
+        `last_event_id` still in the buffer, whether the client missed events
+        that cannot be replayed, and the id after which queued events are new.
+        """
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.add(subscriber)
+            current = self._next_id - 1
+            if last_event_id is None:
+                return subscriber, [], False, current
+            oldest = self._history[0].id if self._history else self._next_id
+            if last_event_id > current or last_event_id + 1 < oldest:
+                return subscriber, [], True, current
+            return subscriber, [e for e in self._history if e.id > last_event_id], False, last_event_id
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    async def stream(self, last_event_id: Optional[int] = None,
+                     keepalive: float = ORDER_EVENTS_KEEPALIVE) -> AsyncIterator[bytes]:
+        """Yield SSE frames: a reset or the missed events, then live events until the subscriber lags."""
+        subscriber, replay, reset, last_id = self.subscribe(last_event_id)
+        try:
+            if reset:
+                yield RESET_MESSAGE
+            for order_event in replay:
+                yield order_event.message
+                last_id = order_event.id
+            while not (subscriber.lagged and subscriber.queue.empty()):
+                try:
+                    batch = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE_MESSAGE
+                    continue
+                # Events published while subscribing can be both replayed and queued.
+                fresh = [order_event for order_event in batch if order_event.id > last_id]
+                if fresh:
+                    yield b''.join(order_event.message for order_event in fresh)
+                    last_id = fresh[-1].id
+        finally:
+            self.unsubscribe(subscriber)
+
+
+bus = OrderEventBus(history=ORDER_EVENTS_HISTORY, queue_size=ORDER_EVENTS_QUEUE_SIZE)
+
+_PENDING = 'pending_order_events'
+
+
+def publish_after_commit(db, event_type: str, data: bytes) -> None:
+    """Publish an event once `db` (a Session or AsyncSession) commits; dropped if it rolls back."""
+    session = getattr(db, 'sync_session', db)
+    session.info.setdefault(_PENDING, []).append((event_type, data))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session):
+    pending = session.info.pop(_PENDING, None)
+    if pending:
+        bus.publish_batch(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(_PENDING, None)
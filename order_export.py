@@ -0,0 +1,65 @@
+"""Streaming export of orders with their line items flattened into rows.
+
+Rows are read through a server-side cursor in fixed-size partitions and
+encoded one partition at a time, so memory stays flat however many orders
+fall in the requested range.
+"""
+
+import csv
+import io
+import json
+import os
+
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import Item, Order, OrderItem
+
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+
+# One row per order line; orders without items get a single row with empty item fields.
+EXPORT_COLUMNS = ('order_id', 'customer_id', 'timestamp', 'notes', 'item_id', 'item_name', 'price', 'quantity')
+
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _export_query(from_ts: int, to_ts: int):
+    return (
+        select(
+            Order.id, Order.customer_id, Order.timestamp, Order.notes,
+            OrderItem.item_id, Item.name, Item.price, OrderItem.quantity,
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Item, Item.id == OrderItem.item_id)
+        .where(Order.timestamp >= from_ts, Order.timestamp < to_ts)
+        .order_by(Order.timestamp, Order.id, OrderItem.item_id)
+    )
+
+
+def _encode_ndjson(rows):
+    return ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), separators=(',', ':')) + '\n' for row in rows)
+
+
+def _encode_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def iter_export(from_ts: int, to_ts: int, fmt: str):
+    """Yield encoded chunks for orders with `from_ts <= timestamp < to_ts`.
+
+    The generator owns its session so it stays open for as long as the
+    response is being streamed.
+    """
+    encode = _encode_csv if fmt == 'csv' else _encode_ndjson
+    if fmt == 'csv':
+        yield _encode_csv([EXPORT_COLUMNS])
+    db = SessionLocal()
+    try:
+        # Without yield_per the ORM fetches every row before returning the first.
+        result = db.execute(_export_query(from_ts, to_ts), execution_options={'yield_per': EXPORT_CHUNK_SIZE})
+        for rows in result.partitions():
+            yield encode(rows)
+    finally:
+        db.close()
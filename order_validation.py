@@ -0,0 +1,41 @@
+"""Checks that an order references an existing customer and existing, distinct menu items.
+
+Shared by single and bulk order creation in the sync and async routes. Callers
+look the ids up with their own session, in chunks from `id_chunks`, and pass the
+ids that exist to the checks.
+"""
+
+from typing import AbstractSet, Iterable, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+from schemas import OrderCreate
+
+# Keep IN (...) lists below SQLite's default bound-parameter limit.
+IN_CLAUSE_CHUNK = 500
+
+
+def id_chunks(ids: Iterable[int]) -> Iterator[List[int]]:
+    """Split `ids` into lists short enough for one IN (...) clause."""
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CLAUSE_CHUNK):
+        yield ids[start:start + IN_CLAUSE_CHUNK]
+
+
+def order_error(order: OrderCreate, customer_ids: AbstractSet[int], item_ids: AbstractSet[int]) -> Optional[str]:
+    """Return why `order` cannot be created, or None if it can."""
+    line_item_ids = [oi.item_id for oi in order.items]
+    if order.customer_id not in customer_ids:
+        return "Customer not found"
+    if any(item_id not in item_ids for item_id in line_item_ids):
+        return "Item not found"
+    if len(set(line_item_ids)) != len(line_item_ids):
+        return "Duplicate item in order"
+    return None
+
+
+def check_order(order: OrderCreate, customer_ids: AbstractSet[int], item_ids: AbstractSet[int]) -> None:
+    """Raise a 422 with the reason if `order` cannot be created."""
+    error = order_error(order, customer_ids, item_ids)
+    if error is not None:
+        raise HTTPException(status_code=422, detail=error)
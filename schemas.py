@@ -1,5 +1,6 @@
 """Module defining Pydantic models for data validation and serialization of API responses for a Dosa restaurant system."""
 
+from enum import Enum
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -17,7 +18,7 @@ class CustomerResponse(CustomerBase):
     id: int
 
     class Config:
-        from_attributes = True
+        orm_mode = True
 
 class ItemBase(BaseModel):
     """Base model for item data, includes fields shared by creation and reading operations."""
@@ -33,7 +34,7 @@ class ItemResponse(ItemBase):
     id: int
 
     class Config:
-        from_attributes = True
+        orm_mode = True
 
 class OrderItemBase(BaseModel):
     """Base model for order item data, used for linking items and orders."""
@@ -46,11 +47,11 @@ class OrderItemCreate(OrderItemBase):
 
 class OrderItemResponse(OrderItemBase):
     """Model for returning order item data, includes detailed item information."""
-    id: int
-    item: ItemResponse  # Ensure that `ItemResponse` is correctly defined or imported
+    order_id: int
+    item: Optional[ItemResponse] = None  # None once the menu item has been deleted
 
     class Config:
-        from_attributes = True
+        orm_mode = True
 
 class OrderBase(BaseModel):
     """Base model for order data, includes fields shared by creation and reading operations."""
@@ -68,4 +69,50 @@ class OrderResponse(OrderBase):
     items: List[OrderItemResponse] = []
 
     class Config:
-        from_attributes = True
+        orm_mode = True
+
+class BulkOrderResult(BaseModel):
+    """Per-order outcome of a bulk order submission, in payload order."""
+    index: int
+    id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
+
+class OrderPage(BaseModel):
+    """A page of orders; pass `next_after_id` back as `after_id` to continue, None on the last page."""
+    orders: List[OrderResponse]
+    next_after_id: Optional[int] = None
+
+class ExportFormat(str, Enum):
+    """Output formats supported by the order export."""
+    ndjson = "ndjson"
+    csv = "csv"
+
+class ItemSales(BaseModel):
+    """Quantity sold and revenue for one menu item."""
+    item_id: int
+    quantity: int
+    revenue: float
+
+    class Config:
+        orm_mode = True
+
+class HourlySales(BaseModel):
+    """Orders, quantity and revenue for the hour starting at `hour`."""
+    hour: int
+    orders: int
+    quantity: int
+    revenue: float
+
+    class Config:
+        orm_mode = True
+
+class CustomerSpend(BaseModel):
+    """Orders, quantity and total spend for one customer."""
+    customer_id: int
+    orders: int
+    quantity: int
+    revenue: float
+
+    class Config:
+        orm_mode = True